@@ -1,18 +1,49 @@
 
 import sys
 import os
+import traceback
+from concurrent import futures
 
 from PyQt5 import QtWidgets, QtCore, QtGui
 
-import constants as ct
+import fingerprint as fp
+import output_cache
+import scheduler
 
 import uuid
 
 open_windows = {}
 
+_executors = {}
+
+
+def get_executor(executor):
+    # One pool of each kind shared by all the transform windows
+    if executor not in _executors:
+        if executor == 'thread':
+            _executors[executor] = futures.ThreadPoolExecutor()
+        elif executor == 'process':
+            _executors[executor] = futures.ProcessPoolExecutor()
+        else:
+            raise ValueError('The executor needs to be None, \'thread\' or \'process\', not {}'.format(executor))
+    return _executors[executor]
+
+
+def discard_executor(pool):
+    # A pool that broke (e.g. one of its workers died, or could not unpickle a function defined in the REPL after the
+    # pool forked) fails everything submitted to it, so it gets dropped and the next submit starts a fresh one
+    for executor, candidate in list(_executors.items()):
+        if candidate is pool:
+            del _executors[executor]
+    pool.shutdown(wait=False)
+
 
 class BasicTransform(QtWidgets.QWidget):
-    def __init__(self, repl_globals, input_var_name, function_name, output_var_name, function_args_name=None):
+    # Emitted (from a pool thread) when an asynchronous calculation of the output finishes
+    output_calculated = QtCore.pyqtSignal(object)
+
+    def __init__(self, repl_globals, input_var_name, function_name, output_var_name, function_args_name=None,
+                 executor=None, output_cache_size=output_cache.DEFAULT_OUTPUT_CACHE_SIZE):
         # call super class constructor
         super(BasicTransform, self).__init__()
 
@@ -29,9 +60,19 @@ class BasicTransform(QtWidgets.QWidget):
 
         self.is_connection_on = True
 
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.update_variable)
-        self.timer.start(ct.TIMER_UPDATE_TIME_MILLIS)
+        # Outputs of the last output_cache_size different (function, input, args) so that the function does not run
+        # again for inputs it has already seen. 0 (the default) turns this off. Only use it for pure functions
+        self.output_cache = output_cache.OutputCache(output_cache_size)
+
+        # With an executor ('thread' or 'process') the function runs in a pool and not in the GUI thread. Only one
+        # calculation runs at a time and only the newest input that arrived during it gets calculated next
+        self.executor = executor
+        self.running_calculation = None
+        self.pending_calculation = None
+        self.is_running_calculation_stale = False
+        self.output_calculated.connect(self._on_output_calculated)
+
+        scheduler.register(self, self.update_variable)
 
         self.resize(300, 100)
         font = QtGui.QFont('Times', pointSize=18, weight=QtGui.QFont.Bold)
@@ -64,10 +105,17 @@ class BasicTransform(QtWidgets.QWidget):
         self.layout_window.addWidget(self.toggle_connection)
 
     def closeEvent(self, event):
+        scheduler.unregister(self)
         del open_windows[self.uuid]
         self.close()
         event.accept()
 
+    def watched_variable_names(self):
+        return [self.input_var_name, self.function_name, self.function_args_name]
+
+    def output_variable_names(self):
+        return [self.output_var_name]
+
     # Needs to be implemented
     def _get_input_var_value(self):
         pass
@@ -115,46 +163,128 @@ class BasicTransform(QtWidgets.QWidget):
             print('Variable {} not defined in the REPL'.format(self.function_args_name))
             self.close()
 
+    def _get_function_args_value(self):
+        if self.function_args_name is not None:
+            return self.function_args_value
+        return []
+
+    def _get_output_cache_key(self, function, function_args_value):
+        # Hashing the whole input is not cheap so it is only done with a cache to look it up in
+        if self.output_cache.max_size < 1:
+            return None
+        return fp.content_key((function, self.input_var_value, tuple(function_args_value)))
+
     def _calculate_output(self):
 
         function = self._get_currently_used_function()
+        function_args_value = self._get_function_args_value()
 
-        if self.function_args_name is not None:
-            output_variable_value = function(self.input_var_value, *self.function_args_value)
-        else:
-            output_variable_value = function(self.input_var_value)
+        key = self._get_output_cache_key(function, function_args_value)
+        is_cached, output_variable_value = self.output_cache.get(key)
+        if is_cached:
+            return output_variable_value
+
+        output_variable_value = function(self.input_var_value, *function_args_value)
+        self.output_cache.put(key, output_variable_value)
 
         return output_variable_value
 
-    def _set_output_variable(self):
-        if self.is_connection_on:
+    def _submit_calculation(self, key, function, input_var_value, function_args_value):
+        pool = get_executor(self.executor)
+        try:
+            self.running_calculation = pool.submit(function, input_var_value, *function_args_value)
+        except Exception as exception:
+            if isinstance(exception, futures.BrokenExecutor):
+                discard_executor(pool)
+            traceback.print_exc()
+            self.running_calculation = None
+            self.label_transfrom_func_name.setStyleSheet("color: red")
+            return
+        self.running_calculation.add_done_callback(
+            lambda calculation: self.output_calculated.emit((key, pool, calculation)))
+        self.label_transfrom_func_name.setStyleSheet("color: orange")
+
+    def _calculate_output_asynchronously(self):
+        function = self._get_currently_used_function()
+        function_args_value = self._get_function_args_value()
+
+        key = self._get_output_cache_key(function, function_args_value)
+        is_cached, output_variable_value = self.output_cache.get(key)
+        if is_cached:
+            # Whatever is running or waiting is now older than what is shown
+            self.pending_calculation = None
+            self.is_running_calculation_stale = self.running_calculation is not None
+            self._show_output_variable(output_variable_value)
+            return
+
+        if self.running_calculation is not None:
+            # Replaces whatever was waiting so that an old input never gets calculated after a newer one
+            self.pending_calculation = (key, function, self.input_var_value, function_args_value)
+        else:
+            self._submit_calculation(key, function, self.input_var_value, function_args_value)
 
-            output_variable_value = self._calculate_output()
+    def _on_output_calculated(self, key_pool_and_calculation):
+        key, pool, calculation = key_pool_and_calculation
+        self.running_calculation = None
 
-            try:
-                self.repl_globals[self.output_var_name] = output_variable_value
-            except KeyError:
-                print('Variable {} not defined in the REPL'.format(self.output_var_name))
-                self.close()
-            try:
-                if output_variable_value.__class__ is bool:
-                    if output_variable_value is True:
-                        self.label_output.setPixmap(self.pixmap_green)
-                    else:
-                        self.label_output.setPixmap(self.pixmap_red)
-                elif output_variable_value.__class__ is int or \
-                        output_variable_value.__class__ is float or \
-                        output_variable_value.__class__ is str:
-                    self.label_output.setText(str(output_variable_value))
-                else:
-                    self.label_output.setText(str(self.output_var_name))
-            except:
-                pass
+        # Before anything else gets submitted to it
+        if isinstance(calculation.exception(), futures.BrokenExecutor):
+            discard_executor(pool)
+
+        is_stale = self.is_running_calculation_stale or self.pending_calculation is not None
+        self.is_running_calculation_stale = False
+        if self.pending_calculation is not None:
+            # This result is already stale so go straight to the newest input
+            pending_calculation = self.pending_calculation
+            self.pending_calculation = None
+            self._submit_calculation(*pending_calculation)
+
+        try:
+            output_variable_value = calculation.result()
+        except Exception:
+            traceback.print_exc()
+            if not is_stale:
+                self.label_transfrom_func_name.setStyleSheet("color: red")
+            return
+
+        # Stale results are still right for their own input so they get cached
+        self.output_cache.put(key, output_variable_value)
+
+        if not is_stale and self.is_connection_on:
+            self._show_output_variable(output_variable_value)
 
-            self.label_transfrom_func_name.setStyleSheet("color: black")
+    def _set_output_variable(self):
+        if self.is_connection_on:
+            if self.executor is not None:
+                self._calculate_output_asynchronously()
+            else:
+                self._show_output_variable(self._calculate_output())
         else:
             self.label_transfrom_func_name.setStyleSheet("color: gray")
 
+    def _show_output_variable(self, output_variable_value):
+        try:
+            self.repl_globals[self.output_var_name] = output_variable_value
+        except KeyError:
+            print('Variable {} not defined in the REPL'.format(self.output_var_name))
+            self.close()
+        try:
+            if output_variable_value.__class__ is bool:
+                if output_variable_value is True:
+                    self.label_output.setPixmap(self.pixmap_green)
+                else:
+                    self.label_output.setPixmap(self.pixmap_red)
+            elif output_variable_value.__class__ is int or \
+                    output_variable_value.__class__ is float or \
+                    output_variable_value.__class__ is str:
+                self.label_output.setText(str(output_variable_value))
+            else:
+                self.label_output.setText(str(self.output_var_name))
+        except:
+            pass
+
+        self.label_transfrom_func_name.setStyleSheet("color: black")
+
     def update_variable(self):
         if self.repl_globals is not None:
             self._get_input_var_value()
@@ -173,6 +303,7 @@ class BasicTransform(QtWidgets.QWidget):
             self.is_connection_on = True
         else:
             self.is_connection_on = False
+        scheduler.mark_dirty(self)
 
 
 if QtWidgets.QApplication.instance() is None:
@@ -0,0 +1,67 @@
+import functools
+
+import numpy as np
+
+
+LUT_CACHE_SIZE = 64
+
+
+def freeze(value):
+    # Turns lists and arrays (e.g. of levels, colormaps or opacities read from the REPL) into tuples so they can be
+    # used as keys
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def _get_colormap(colormap_name):
+    # matplotlib is only imported the first time a colormap is asked for
+    import matplotlib
+    try:
+        return matplotlib.colormaps[colormap_name]
+    except AttributeError:
+        import matplotlib.pyplot as plt
+        return plt.get_cmap(colormap_name)
+
+
+@functools.lru_cache(maxsize=LUT_CACHE_SIZE)
+def _get_lut(colormap_name, max_level, opacity):
+    if colormap_name is None:
+        lut = max_level * np.ones((259, 4))
+    else:
+        lut = _get_colormap(colormap_name)(np.linspace(0, 1, 256)) * max_level
+
+    if opacity is not None:
+        lut[:, 3] = opacity
+    else:
+        lut[:, 3] = 255
+
+    # The same array is given to everyone who asks for these inputs
+    lut.setflags(write=False)
+    return lut
+
+
+def get_lut(colormap_name=None, levels=None, opacity=None):
+    # A (number of colours, 4) RGBA look up table that goes up to the top of the levels (255 if there are none), with
+    # the opacity as its alpha. Without a colormap it is all the same (white) colour.
+    max_level = 255 if levels is None else levels[1]
+    return _get_lut(colormap_name, max_level, opacity)
+
+
+@functools.lru_cache(maxsize=LUT_CACHE_SIZE)
+def get_premultiplied_lut(colormap_name=None, opacity=None):
+    # A (256, 4) float32 RGBA look up table with values from 0 to 1 and the colours already multiplied by the alpha
+    # (opacity goes from 0 to 255 as in get_lut). Without a colormap it is a grey ramp
+    if colormap_name is None:
+        lut = np.repeat(np.linspace(0, 1, 256)[:, np.newaxis], 4, axis=1)
+    else:
+        lut = _get_colormap(colormap_name)(np.linspace(0, 1, 256))
+
+    lut[:, 3] = 1 if opacity is None else opacity / 255
+    lut[:, :3] *= lut[:, 3:]
+
+    lut = lut.astype(np.float32)
+    lut.setflags(write=False)
+    return lut
@@ -0,0 +1,63 @@
+import numpy as np
+
+
+class _OverlayLayer:
+    # What is needed to blend one RGBA overlay, worked out once: the (flat) indices of its visible pixels, their
+    # colours already multiplied by their alpha and how much of the frame underneath is kept (1 - alpha)
+    def __init__(self, overlay):
+        overlay = np.asarray(overlay)
+        self.shape = overlay.shape[:2]
+
+        alpha = overlay[:, :, 3].astype(np.float32)
+        if np.issubdtype(overlay.dtype, np.integer):
+            alpha /= 255
+        alpha = np.clip(alpha, 0, 1).ravel()
+
+        self.indices = np.flatnonzero(alpha > 0)
+        alpha = alpha[self.indices][:, np.newaxis]
+        colour = overlay[:, :, :3].reshape(-1, 3)[self.indices].astype(np.float32)
+
+        self.keep = 1 - alpha
+        self.colour = colour * alpha
+        # Grey frames get the overlay's grey level
+        self.grey = colour.mean(axis=1, keepdims=True) * alpha
+
+
+class OverlayCompositor:
+    # Alpha blends any number of RGBA overlays (in order) on top of frames. The overlays get prepared once (see
+    # set_overlays) and then every frame only costs as much as the number of visible overlay pixels. The frames are
+    # never changed, the result goes into a buffer that gets reused from frame to frame.
+    def __init__(self):
+        self.layers = []
+        self.output = None
+
+    def set_overlays(self, overlays, transpose=False):
+        # overlays is an RGBA image or a list of them. With transpose=True they get the frames' [1, 0, 2] transpose
+        if isinstance(overlays, np.ndarray) and overlays.ndim == 3:
+            overlays = [overlays]
+        if transpose:
+            overlays = [np.transpose(overlay, [1, 0, 2]) for overlay in overlays]
+        self.layers = [_OverlayLayer(overlay) for overlay in overlays]
+
+    def fits(self, frame):
+        return all(layer.shape == frame.shape[:2] for layer in self.layers)
+
+    def compose(self, frame):
+        if not self.layers:
+            return frame
+
+        if self.output is None or self.output.shape != frame.shape or self.output.dtype != frame.dtype:
+            self.output = np.empty(frame.shape, dtype=frame.dtype)
+        np.copyto(self.output, frame)
+
+        pixels = self.output.reshape(frame.shape[0] * frame.shape[1], -1)
+        number_of_colours = min(pixels.shape[1], 3)
+        is_integer = np.issubdtype(frame.dtype, np.integer)
+        for layer in self.layers:
+            colour = layer.grey if number_of_colours == 1 else layer.colour[:, :number_of_colours]
+            blended = pixels[layer.indices, :number_of_colours] * layer.keep + colour
+            if is_integer:
+                np.rint(blended, out=blended)
+            pixels[layer.indices, :number_of_colours] = blended
+
+        return self.output
@@ -0,0 +1,121 @@
+import numpy as np
+
+
+PYRAMID_BASE_BLOCK_SIZE = 64
+PYRAMID_FACTOR = 4
+PYRAMID_BUILD_CHUNK_SIZE = 2 ** 20
+# The most memory the pyramid of a streamed memmap gets to use (see base_block_size_for)
+STREAMED_PYRAMID_MAX_BYTES = 16 * 2 ** 20
+
+
+def _as_channels(data):
+    if len(data.shape) == 1:
+        return data[np.newaxis, :]
+    return data
+
+
+def _interleave(mins, maxs):
+    # Every bin becomes a vertical line from its min to its max so that no peak gets lost
+    result = np.empty(mins.shape[:-1] + (2 * mins.shape[-1],), dtype=np.result_type(mins, maxs))
+    result[..., 0::2] = mins
+    result[..., 1::2] = maxs
+    return result
+
+
+def bin_starts(start, stop, number_of_bins):
+    # The first sample of each of the number_of_bins (almost) equally sized bins that split [start, stop)
+    return np.linspace(start, stop, number_of_bins + 1)[:-1].astype(np.int64)
+
+
+def minmax_decimate(data, number_of_bins):
+    # data is (channels, samples) or (samples,). Returns the x positions (in samples) and the
+    # (channels, 2 * number_of_bins) interleaved mins and maxs of each bin for all channels at once
+    data = _as_channels(data)
+    number_of_bins = min(number_of_bins, data.shape[-1])
+    starts = bin_starts(0, data.shape[-1], number_of_bins)
+
+    mins = np.minimum.reduceat(data, starts, axis=-1)
+    maxs = np.maximum.reduceat(data, starts, axis=-1)
+
+    return np.repeat(starts, 2), _interleave(mins, maxs)
+
+
+def base_block_size_for(data, max_bytes=STREAMED_PYRAMID_MAX_BYTES, factor=PYRAMID_FACTOR):
+    # The smallest base block size (but not smaller than PYRAMID_BASE_BLOCK_SIZE) that keeps the mins and maxs of all
+    # the levels of a MinMaxPyramid of data within max_bytes
+    channels = _as_channels(data)
+    pyramid_bytes_per_block = 2 * channels.shape[0] * channels.dtype.itemsize * factor / (factor - 1)
+    return max(PYRAMID_BASE_BLOCK_SIZE, int(np.ceil(channels.shape[-1] * pyramid_bytes_per_block / max_bytes)))
+
+
+class MinMaxPyramid:
+    # Mins and maxs of blocks of PYRAMID_BASE_BLOCK_SIZE samples, then of blocks of PYRAMID_FACTOR of those and so on.
+    # A view over any range then only needs to look at about PYRAMID_FACTOR blocks per bin, whatever the range is.
+    def __init__(self, data, base_block_size=PYRAMID_BASE_BLOCK_SIZE, factor=PYRAMID_FACTOR,
+                 build_chunk_size=PYRAMID_BUILD_CHUNK_SIZE):
+        self.data = data
+        self.base_block_size = base_block_size
+        self.factor = factor
+        self.levels = []
+
+        channels = _as_channels(data)
+        number_of_samples = channels.shape[-1]
+
+        # Build the first level in chunks so that memmaps do not need to be read into memory all at once
+        build_chunk_size = max(base_block_size, build_chunk_size - build_chunk_size % base_block_size)
+        number_of_blocks = int(np.ceil(number_of_samples / base_block_size))
+        mins = np.empty((channels.shape[0], number_of_blocks), dtype=channels.dtype)
+        maxs = np.empty((channels.shape[0], number_of_blocks), dtype=channels.dtype)
+        for chunk_start in np.arange(0, number_of_samples, build_chunk_size):
+            chunk = np.asarray(channels[:, chunk_start:chunk_start + build_chunk_size])
+            starts = np.arange(0, chunk.shape[-1], base_block_size)
+            first_block = chunk_start // base_block_size
+            mins[:, first_block:first_block + len(starts)] = np.minimum.reduceat(chunk, starts, axis=-1)
+            maxs[:, first_block:first_block + len(starts)] = np.maximum.reduceat(chunk, starts, axis=-1)
+
+        block_size = base_block_size
+        self.levels.append((block_size, mins, maxs))
+        while mins.shape[-1] > factor:
+            starts = np.arange(0, mins.shape[-1], factor)
+            mins = np.minimum.reduceat(mins, starts, axis=-1)
+            maxs = np.maximum.reduceat(maxs, starts, axis=-1)
+            block_size *= factor
+            self.levels.append((block_size, mins, maxs))
+
+    def _level_for(self, samples_per_bin):
+        level = None
+        for candidate in self.levels:
+            if candidate[0] <= samples_per_bin:
+                level = candidate
+        return level
+
+    def query(self, start, stop, number_of_bins):
+        # Returns the same as minmax_decimate(data[..., start:stop], number_of_bins) (with the bin edges rounded to
+        # the block size of the level used) or None if the bins are smaller than the smallest block
+        level = self._level_for((stop - start) / number_of_bins)
+        if level is None:
+            return None
+        block_size, mins, maxs = level
+
+        starts = bin_starts(start, stop, number_of_bins)
+        first_block = starts[0] // block_size
+        last_block = min(int(np.ceil(stop / block_size)), mins.shape[-1])
+        block_starts = np.minimum(starts // block_size, last_block - 1) - first_block
+
+        bin_mins = np.minimum.reduceat(mins[:, first_block:last_block], block_starts, axis=-1)
+        bin_maxs = np.maximum.reduceat(maxs[:, first_block:last_block], block_starts, axis=-1)
+
+        return np.repeat(starts - start, 2), _interleave(bin_mins, bin_maxs)
+
+
+def to_plot_data(x, y):
+    # Flattens the (channels, points) output of the decimation into the x, y and connect arrays that a single
+    # pg.PlotDataItem needs to show each channel as an independent line
+    x = np.tile(x, y.shape[0])
+    if y.shape[0] == 1:
+        connect = 'all'
+    else:
+        connect = np.ones(y.size)
+        connect[np.arange(y.shape[1] - 1, y.size, y.shape[1])] = 0
+
+    return x, y.flatten(), connect
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+# Scatter plots with more points than this are drawn as a density image
+DENSITY_THRESHOLD = 100000
+
+
+def data_range(values):
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return 0., 1.
+    minimum, maximum = float(finite.min()), float(finite.max())
+    if minimum == maximum:
+        return minimum - 0.5, maximum + 0.5
+    return minimum, maximum
+
+
+def density_raster(x, y, x_range, y_range, width, height):
+    # Counts how many of the points fall into each of the width x height pixels that the ranges get split into.
+    # The result is indexed as [x pixel, y pixel] (pyqtgraph's default image axis order)
+    x = np.ravel(x)
+    y = np.ravel(y)
+    width = max(1, int(width))
+    height = max(1, int(height))
+    x_start, x_end = x_range
+    y_start, y_end = y_range
+
+    inside = (x >= x_start) & (x <= x_end) & (y >= y_start) & (y <= y_end)
+    x = x[inside]
+    y = y[inside]
+
+    x_pixels = ((x - x_start) * (width / (x_end - x_start))).astype(np.intp)
+    y_pixels = ((y - y_start) * (height / (y_end - y_start))).astype(np.intp)
+    # Points right on the end of a range go into the last pixel
+    np.minimum(x_pixels, width - 1, out=x_pixels)
+    np.minimum(y_pixels, height - 1, out=y_pixels)
+
+    counts = np.bincount(x_pixels * height + y_pixels, minlength=width * height)
+    return counts.reshape(width, height)
+
+
+def density_lut(color=(0, 0, 0)):
+    # Empty pixels are transparent and the rest get more opaque the more points they have
+    lut = np.zeros((256, 4), dtype=np.uint8)
+    lut[:, :3] = color
+    lut[1:, 3] = np.linspace(64, 255, 255)
+    return lut
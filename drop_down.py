@@ -2,12 +2,16 @@
 from PyQt5 import QtWidgets
 
 import basic_transform as bt
+import output_cache as oc
+import scheduler
 
 
 class MainWindow(bt.BasicTransform):
-    def __init__(self, repl_globals, input_var_name, function_name, output_var_name, function_args_name=None):
+    def __init__(self, repl_globals, input_var_name, function_name, output_var_name, function_args_name=None,
+                 executor=None, output_cache_size=oc.DEFAULT_OUTPUT_CACHE_SIZE):
         # call super class constructor
-        super(MainWindow, self).__init__(repl_globals, input_var_name, function_name, output_var_name, function_args_name)
+        super(MainWindow, self).__init__(repl_globals, input_var_name, function_name, output_var_name, function_args_name,
+                                         executor, output_cache_size)
 
         self.input_widget = QtWidgets.QComboBox()
         try:
@@ -18,18 +22,25 @@ class MainWindow(bt.BasicTransform):
         for item in drop_down_variable:
             self.input_widget.addItem(str(item), item)
         self.input_widget.setCurrentIndex(0)
+        self.input_widget.currentIndexChanged.connect(self._on_current_index_changed)
 
         self.layout_labels.addWidget(self.input_widget)
         self.layout_labels.addWidget(self.label_transfrom_func_name)
         self.layout_labels.addWidget(self.label_output)
 
+    def _on_current_index_changed(self):
+        # The input of a drop down comes from the widget and not the REPL so the scheduler cannot see it change
+        scheduler.mark_dirty(self)
+
     def _get_input_var_value(self):
         index = self.input_widget.currentIndex()
         self.input_var_value = self.input_widget.itemData(index)
 
 
-def connect_repl_var(repl_globals, input_var_name, function_name, output_var_name, function_args_name=None):
-    win = MainWindow(repl_globals, input_var_name, function_name, output_var_name, function_args_name)
+def connect_repl_var(repl_globals, input_var_name, function_name, output_var_name, function_args_name=None,
+                     executor=None, output_cache_size=oc.DEFAULT_OUTPUT_CACHE_SIZE):
+    win = MainWindow(repl_globals, input_var_name, function_name, output_var_name, function_args_name, executor,
+                     output_cache_size)
     bt.open_windows[win.uuid] = win
     win.show()
 
@@ -0,0 +1,84 @@
+import hashlib
+
+import numpy as np
+
+
+NUMBER_OF_SAMPLES = 64
+# Arrays up to this size get all of their content hashed, bigger ones only a few samples of it
+FULL_HASH_BYTES = 2 ** 20
+MAX_SEQUENCE_LENGTH = 16
+
+
+def _sample_array(array, number_of_samples):
+    # Evenly spaced elements of the flattened array, gathered by their indices so that nothing bigger than the samples
+    # gets copied whatever the strides are
+    if array.ndim == 0:
+        return array.reshape(1)
+    step = max(1, array.size // number_of_samples)
+    flat_indices = np.arange(min(array.size, number_of_samples)) * step
+    return array[np.unravel_index(flat_indices, array.shape)]
+
+
+def array_fingerprint(array, number_of_samples=NUMBER_OF_SAMPLES):
+    # Identity, shape and dtype plus a hash of the content for arrays of up to FULL_HASH_BYTES, or of a few strided
+    # samples for bigger ones. For those it is not exact, an in place change that misses all the samples will not be
+    # seen (use a version counter for those cases)
+    key = (id(array), array.shape, array.dtype.str)
+
+    # Sampling a memmap hits the disk in number_of_samples different places so only the identity is used
+    if isinstance(array, np.memmap) or array.size == 0:
+        return key
+
+    if array.nbytes <= FULL_HASH_BYTES:
+        return key + (hash(array.tobytes()),)
+
+    return key + (hash(_sample_array(array, number_of_samples).tobytes()),)
+
+
+def fingerprint(value):
+    if isinstance(value, np.ndarray):
+        return array_fingerprint(value)
+
+    if isinstance(value, (list, tuple)) and len(value) <= MAX_SEQUENCE_LENGTH:
+        return (id(value), type(value).__name__) + tuple(fingerprint(v) for v in value)
+
+    try:
+        hash(value)
+    except TypeError:
+        pass
+    else:
+        # The value itself and not its hash, which is the same for e.g. -1 and -2. NaN is not equal to itself so it
+        # gets its repr
+        if isinstance(value, (float, complex, np.floating, np.complexfloating)) and np.isnan(value):
+            return type(value).__name__, repr(value)
+        return type(value).__name__, value
+
+    try:
+        length = len(value)
+    except TypeError:
+        length = None
+
+    return id(value), length
+
+
+def content_key(value):
+    # Unlike fingerprint, equal keys mean equal values so the key can be used to look up results calculated from the
+    # value. Arrays get their whole content hashed. Returns None for values that are neither arrays, sequences nor
+    # hashable
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return None
+        digest = hashlib.blake2b(np.ascontiguousarray(value).data, digest_size=16).digest()
+        return 'ndarray', value.shape, value.dtype.str, digest
+
+    if isinstance(value, (list, tuple)):
+        keys = tuple(content_key(v) for v in value)
+        if any(key is None for key in keys):
+            return None
+        return (type(value).__name__,) + keys
+
+    try:
+        hash(value)
+    except TypeError:
+        return None
+    return type(value).__name__, value
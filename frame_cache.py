@@ -0,0 +1,38 @@
+from collections import OrderedDict
+
+
+DEFAULT_FRAME_CACHE_BYTES = 256 * 2 ** 20
+
+
+class FrameCache:
+    # Least recently used cache of ready to display frames that keeps the total size of the frames under max_bytes
+    def __init__(self, max_bytes=DEFAULT_FRAME_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.number_of_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            frame = self.frames[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.frames.move_to_end(key)
+        self.hits += 1
+        return frame
+
+    def put(self, key, frame):
+        if frame.nbytes > self.max_bytes:
+            return
+        if key in self.frames:
+            self.number_of_bytes -= self.frames.pop(key).nbytes
+        self.frames[key] = frame
+        self.number_of_bytes += frame.nbytes
+        while self.number_of_bytes > self.max_bytes:
+            self.number_of_bytes -= self.frames.popitem(last=False)[1].nbytes
+
+    def clear(self):
+        self.frames.clear()
+        self.number_of_bytes = 0
@@ -0,0 +1,122 @@
+import atexit
+import threading
+from collections import OrderedDict
+
+import cv2
+
+import video_index
+
+
+FRAME_BUFFER_SIZE = 64
+FRAME_WAIT_TIMEOUT_SECONDS = 2
+
+
+class VideoFrameReader:
+    # Decodes the frames of a video file in a worker thread, sequentially and ahead of the last requested frame, into a
+    # bounded buffer. The capture only seeks when a frame is asked for that is neither in the buffer nor within
+    # buffer_size frames ahead of the decoder, so during playback the GUI thread only picks up already decoded frames.
+    # Seeks go to the nearest keyframe (see video_index) and decode forward from there.
+    # The capture is only ever touched by the worker thread.
+    # The video index gets loaded or built in a second thread. Until it is there frame_count is what the container
+    # says and seeks go straight to the frame. on_index_built (if given) gets called from that thread once it is there
+    def __init__(self, file_name, buffer_size=FRAME_BUFFER_SIZE, on_index_built=None):
+        self.file_name = file_name
+        self.video_index = None
+        self.on_index_built = on_index_built
+        self.capture = cv2.VideoCapture(file_name)
+        self.frame_count = max(0, int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.buffer_size = buffer_size
+
+        self.frames = OrderedDict()
+        self.condition = threading.Condition()
+        self.requested_index = 0
+        self.next_index = 0
+        self.end_index = self.frame_count
+        self.is_running = True
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.index_thread = threading.Thread(target=self._build_index, daemon=True)
+        self.index_thread.start()
+        # A decoder thread still inside the capture when the interpreter shuts down aborts the process
+        atexit.register(self.close)
+
+    def _build_index(self):
+        index = video_index.load_or_build(self.file_name, lambda: not self.is_running)
+        if index is None:
+            return
+        with self.condition:
+            self.video_index = index
+            self.frame_count = index.frame_count
+            self.end_index = index.frame_count
+            self.condition.notify_all()
+        if self.on_index_built is not None:
+            self.on_index_built()
+
+    def _nearest_keyframe(self, index):
+        if self.video_index is None:
+            return index
+        return self.video_index.nearest_keyframe(index)
+
+    def _needs_seek(self):
+        # Going forwards a seek only helps if there is a keyframe after the frame the decoder is at
+        if self.requested_index in self.frames:
+            return False
+        if self.requested_index < self.next_index:
+            return True
+        return self.requested_index >= self.next_index + self.buffer_size and \
+            self._nearest_keyframe(self.requested_index) > self.next_index
+
+    def _has_work(self):
+        if self._needs_seek():
+            return self.requested_index < self.end_index
+        return self.next_index < min(self.requested_index + self.buffer_size, self.end_index)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.is_running and not self._has_work():
+                    self.condition.wait()
+                if not self.is_running:
+                    break
+
+                is_seeking = self._needs_seek()
+                if is_seeking:
+                    self.frames.clear()
+                    self.next_index = self._nearest_keyframe(self.requested_index)
+                index = self.next_index
+
+            if is_seeking:
+                self.capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ok, frame = self.capture.read()
+
+            with self.condition:
+                if ok:
+                    self.frames[index] = frame
+                    self.next_index = index + 1
+                    while len(self.frames) > self.buffer_size:
+                        self.frames.popitem(last=False)
+                else:
+                    # The container had fewer frames than it said it had
+                    self.end_index = index
+                self.condition.notify_all()
+
+        self.capture.release()
+
+    def get_frame(self, index, timeout=FRAME_WAIT_TIMEOUT_SECONDS):
+        with self.condition:
+            self.requested_index = index
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: index in self.frames or index >= self.end_index or not self.is_running,
+                                    timeout)
+            return self.frames.get(index)
+
+    def close(self):
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+        for thread in (self.thread, self.index_thread):
+            if thread is not threading.current_thread():
+                thread.join()
+        atexit.unregister(self.close)
@@ -0,0 +1,124 @@
+import time
+
+import numpy as np
+from PyQt5 import QtCore, QtGui
+from PyQt5.QtMultimedia import QAbstractVideoBuffer, QAbstractVideoSurface, QVideoFrame
+
+
+DEFAULT_MAX_FRAME_RATE = 10
+
+# For the packed RGB formats, the bytes per pixel and where in them (in memory, little endian) the R, G and B are
+_PIXEL_LAYOUTS = {
+    QVideoFrame.Format_RGB32: (4, [2, 1, 0]),
+    QVideoFrame.Format_ARGB32: (4, [2, 1, 0]),
+    QVideoFrame.Format_ARGB32_Premultiplied: (4, [2, 1, 0]),
+    QVideoFrame.Format_BGR32: (4, [1, 2, 3]),
+    QVideoFrame.Format_BGRA32: (4, [1, 2, 3]),
+    QVideoFrame.Format_BGRA32_Premultiplied: (4, [1, 2, 3]),
+    QVideoFrame.Format_RGB24: (3, [0, 1, 2]),
+    QVideoFrame.Format_BGR24: (3, [2, 1, 0]),
+}
+
+
+def _packed_pixels(bits, number_of_bytes, height, width, bytes_per_line, bytes_per_pixel):
+    # A view (no copy) of the mapped memory as (height, width, bytes_per_pixel), without the padding of the lines
+    bits.setsize(number_of_bytes)
+    buffer = np.frombuffer(bits, dtype=np.uint8)
+    lines = buffer[:height * bytes_per_line].reshape(height, bytes_per_line)
+    return lines[:, :width * bytes_per_pixel].reshape(height, width, bytes_per_pixel)
+
+
+def _image_to_array(frame):
+    # For the formats that are not packed RGB (e.g. YUV) Qt does the conversion
+    image = frame.image().convertToFormat(QtGui.QImage.Format_RGB888)
+    if image.isNull():
+        return None
+    return np.array(_packed_pixels(image.constBits(), image.sizeInBytes(), image.height(), image.width(),
+                                   image.bytesPerLine(), 3))
+
+
+def frame_to_array(frame):
+    # The frame as a (height, width, 3) RGB uint8 array. The pixels get copied once, straight into RGB order
+    frame = QVideoFrame(frame)
+    layout = _PIXEL_LAYOUTS.get(frame.pixelFormat())
+    if layout is None:
+        return _image_to_array(frame)
+
+    if not frame.map(QAbstractVideoBuffer.ReadOnly):
+        return None
+    try:
+        bytes_per_pixel, channels = layout
+        pixels = _packed_pixels(frame.bits(), frame.mappedBytes(), frame.height(), frame.width(),
+                                frame.bytesPerLine(), bytes_per_pixel)
+        return pixels[:, :, channels]
+    finally:
+        frame.unmap()
+
+
+class FrameTapSurface(QAbstractVideoSurface):
+    # Goes between a QMediaPlayer and the surface that shows its video (e.g. QVideoWidget.videoSurface()). Every frame
+    # gets passed on to that surface and, at most max_frame_rate times a second, also given to on_frame as an RGB
+    # ndarray. A frame skipped because of the rate gets given once it is allowed (if no newer one came in by then), so
+    # after a pause or a seek on_frame always gets the frame that is on the screen.
+    def __init__(self, target_surface, on_frame, max_frame_rate=DEFAULT_MAX_FRAME_RATE, parent=None):
+        super(FrameTapSurface, self).__init__(parent)
+
+        self.target_surface = target_surface
+        self.on_frame = on_frame
+        self.minimum_interval = 1 / max_frame_rate
+        self.last_publish_time = None
+        self.pending_frame = None
+
+        self.publish_timer = QtCore.QTimer()
+        self.publish_timer.setSingleShot(True)
+        self.publish_timer.timeout.connect(self._publish_pending_frame)
+
+    def supportedPixelFormats(self, handle_type=QAbstractVideoBuffer.NoHandle):
+        # Only frames in memory (and not e.g. in OpenGL textures) can be turned into arrays
+        if handle_type != QAbstractVideoBuffer.NoHandle:
+            return []
+        if self.target_surface is not None:
+            return self.target_surface.supportedPixelFormats(handle_type)
+        return list(_PIXEL_LAYOUTS.keys())
+
+    def isFormatSupported(self, surface_format):
+        if self.target_surface is not None:
+            return self.target_surface.isFormatSupported(surface_format)
+        return surface_format.pixelFormat() in _PIXEL_LAYOUTS
+
+    def start(self, surface_format):
+        if self.target_surface is not None and not self.target_surface.start(surface_format):
+            return False
+        return super(FrameTapSurface, self).start(surface_format)
+
+    def stop(self):
+        self.publish_timer.stop()
+        self.pending_frame = None
+        if self.target_surface is not None:
+            self.target_surface.stop()
+        super(FrameTapSurface, self).stop()
+
+    def _publish(self, frame):
+        self.last_publish_time = time.monotonic()
+        self.pending_frame = None
+        array = frame_to_array(frame)
+        if array is not None:
+            self.on_frame(array)
+
+    def _publish_pending_frame(self):
+        if self.pending_frame is not None:
+            self._publish(self.pending_frame)
+
+    def present(self, frame):
+        now = time.monotonic()
+        if self.last_publish_time is None or now - self.last_publish_time >= self.minimum_interval:
+            self._publish(frame)
+        else:
+            self.pending_frame = QVideoFrame(frame)
+            if not self.publish_timer.isActive():
+                wait = self.minimum_interval - (now - self.last_publish_time)
+                self.publish_timer.start(max(1, int(1000 * wait)))
+
+        if self.target_surface is None:
+            return True
+        return self.target_surface.present(frame)
@@ -0,0 +1,247 @@
+import hashlib
+import os
+from concurrent import futures
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt5 import QtCore
+
+import colormaps
+import fingerprint as fp
+import frame_cache
+
+
+TILE_SIZE = 512
+# Single images with more pixels than this are shown tiled (see one_shot_viewer.image)
+TILED_IMAGE_PIXELS = 4096 * 4096
+TILE_CACHE_BYTES = 256 * 2 ** 20
+# The most pixels along a side of the strided preview shown while a pyramid gets built
+PREVIEW_SIZE = 1024
+
+_pyramid_executor = None
+
+
+def _get_pyramid_executor():
+    global _pyramid_executor
+    if _pyramid_executor is None:
+        _pyramid_executor = futures.ThreadPoolExecutor(max_workers=1)
+    return _pyramid_executor
+
+
+def _downsample(strip):
+    # The mean of every 2 x 2 block of pixels (an odd last row or column is dropped)
+    rows = strip.shape[0] // 2 * 2
+    columns = strip.shape[1] // 2 * 2
+    strip = strip[:rows, :columns]
+    return strip.reshape((rows // 2, 2, columns // 2, 2) + strip.shape[2:]).mean(axis=(1, 3))
+
+
+def _cache_file_prefix(image, cache_directory):
+    # Only images memmapped from a file can be recognised again, by the file's name, size and modification time
+    file_name = getattr(image, 'filename', None)
+    if cache_directory is None or file_name is None:
+        return None
+    stat = os.stat(file_name)
+    key = repr((os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns, getattr(image, 'offset', 0),
+                image.shape, image.strides, image.dtype.str))
+    return os.path.join(cache_directory, hashlib.blake2b(key.encode(), digest_size=8).hexdigest())
+
+
+class ImagePyramid:
+    # The image (level 0, which is never copied so it can be a memmap) and versions of it that are each half the size
+    # of the one before, down to a single tile. The levels get built once, in strips of rows so that a memmapped image
+    # is never read whole, and are kept in memory, or with a cache_directory as .npy files that get reused the next
+    # time the same memmapped image is shown. Together they are a third of the size of the image.
+    def __init__(self, image, tile_size=TILE_SIZE, cache_directory=None):
+        self.tile_size = tile_size
+        self.levels = [image]
+
+        dtype = np.float32 if image.dtype == bool else image.dtype
+        file_prefix = _cache_file_prefix(image, cache_directory)
+        level = image
+        while max(level.shape[:2]) > tile_size:
+            shape = (level.shape[0] // 2, level.shape[1] // 2) + level.shape[2:]
+            file_name = None if file_prefix is None else '{}_{}.npy'.format(file_prefix, len(self.levels))
+
+            next_level = None
+            if file_name is not None and os.path.exists(file_name):
+                next_level = np.load(file_name, mmap_mode='r')
+                if next_level.shape != shape or next_level.dtype != dtype:
+                    next_level = None
+
+            if next_level is None:
+                if file_name is None:
+                    next_level = np.empty(shape, dtype=dtype)
+                else:
+                    next_level = np.lib.format.open_memmap(file_name, mode='w+', dtype=dtype, shape=shape)
+                for start in range(0, 2 * shape[0], 2 * tile_size):
+                    stop = min(start + 2 * tile_size, 2 * shape[0])
+                    next_level[start // 2:stop // 2] = _downsample(np.asarray(level[start:stop]))
+                if file_name is not None:
+                    next_level.flush()
+
+            self.levels.append(next_level)
+            level = next_level
+
+    def level_for(self, image_pixels_per_screen_pixel):
+        level = int(np.floor(np.log2(max(1, image_pixels_per_screen_pixel))))
+        return min(level, len(self.levels) - 1)
+
+    def tiles(self, level, x_range, y_range):
+        # The (row, column) of the tiles of a level that the ranges (in pixels of the image) fall on
+        tile_size = self.tile_size * 2 ** level
+        rows, columns = self.levels[level].shape[:2]
+        row_range = range(max(0, int(y_range[0] // tile_size)),
+                          min(-(-rows // self.tile_size), int(y_range[1] // tile_size) + 1))
+        column_range = range(max(0, int(x_range[0] // tile_size)),
+                             min(-(-columns // self.tile_size), int(x_range[1] // tile_size) + 1))
+        return [(row, column) for row in row_range for column in column_range]
+
+    def tile(self, level, row, column):
+        start_row = row * self.tile_size
+        start_column = column * self.tile_size
+        return np.asarray(self.levels[level][start_row:start_row + self.tile_size,
+                                             start_column:start_column + self.tile_size])
+
+
+class TiledImageWidget(pg.GraphicsLayoutWidget):
+    # Shows an image through an ImagePyramid, putting through the LUT and drawing only the tiles that are in view, at
+    # the level that has about one pixel per screen pixel. The tiles that went through the LUT are kept in a cache of
+    # at most tile_cache_bytes. Tiles get updated once panning or zooming stops for a moment.
+    # The pyramid gets built in the background and until it is there a preview made of every so many pixels of the
+    # image (at most PREVIEW_SIZE along a side) is shown
+    # Emitted (from the thread that built it) with the future of an ImagePyramid once it is built
+    pyramid_built = QtCore.pyqtSignal(object)
+
+    def __init__(self, tile_cache_bytes=TILE_CACHE_BYTES, cache_directory=None):
+        super(TiledImageWidget, self).__init__()
+
+        self.cache_directory = cache_directory
+        self.pyramid = None
+        self.pyramid_future = None
+        self.image = None
+        self.image_key = None
+        self.preview = None
+        self.levels = None
+        self.lut = colormaps.get_premultiplied_lut()
+        self.tile_cache = frame_cache.FrameCache(tile_cache_bytes)
+        self.tile_items = {}
+
+        self.view_box = self.addViewBox()
+        self.view_box.setAspectLocked(True)
+        self.view_box.invertY(True)
+
+        self.tiles_timer = QtCore.QTimer()
+        self.tiles_timer.setSingleShot(True)
+        self.tiles_timer.setInterval(30)
+        self.tiles_timer.timeout.connect(self._update_tiles)
+        self.view_box.sigRangeChanged.connect(self.tiles_timer.start)
+        self.view_box.sigResized.connect(self.tiles_timer.start)
+
+        self.preview_item = pg.ImageItem(axisOrder='row-major')
+        self.view_box.addItem(self.preview_item, ignoreBounds=True)
+        self.pyramid_built.connect(self._on_pyramid_built)
+
+    def _clear_tiles(self):
+        for item in self.tile_items.values():
+            self.view_box.removeItem(item)
+        self.tile_items = {}
+        self.tile_cache.clear()
+
+    def set_image(self, image, levels=None, colormap_name=None, opacity=None, flip=None, version=None):
+        # A new version (see scheduler.get_version) rebuilds the pyramid for in place changes the fingerprint misses
+        image_key = (image.__array_interface__['data'][0],) + fp.array_fingerprint(image)[1:] + (version,)
+        is_new_image = image_key != self.image_key
+        if is_new_image:
+            self.image_key = image_key
+            is_new_shape = self.image is None or self.image.shape != image.shape
+            self.image = image
+            self.pyramid = None
+            self._clear_tiles()
+            step = max(1, -(-max(image.shape[:2]) // PREVIEW_SIZE))
+            self.preview = np.asarray(image[::step, ::step])
+            self.pyramid_future = _get_pyramid_executor().submit(ImagePyramid, image,
+                                                                 cache_directory=self.cache_directory)
+            self.pyramid_future.add_done_callback(self.pyramid_built.emit)
+            if is_new_shape:
+                self.view_box.setRange(xRange=(0, image.shape[1]), yRange=(0, image.shape[0]))
+
+        levels = colormaps.freeze(levels)
+        lut = colormaps.get_premultiplied_lut(colormap_name, opacity)
+        is_new_lut = levels != self.levels or lut is not self.lut
+        if is_new_lut:
+            self.levels = levels
+            self.lut = lut
+            self._clear_tiles()
+
+        self.view_box.invertY(flip not in ('ud', 'udlr'))
+        self.view_box.invertX(flip in ('lr', 'udlr'))
+
+        if self.pyramid is None and (is_new_image or is_new_lut):
+            self._update_preview()
+        self._update_tiles()
+
+    def _update_preview(self):
+        self.preview_item.setImage(self._map_tile(self.preview), levels=(0, 255))
+        self.preview_item.setRect(QtCore.QRectF(0, 0, self.image.shape[1], self.image.shape[0]))
+        self.preview_item.show()
+
+    def _on_pyramid_built(self, future):
+        if future is not self.pyramid_future or future.exception() is not None:
+            return
+        self.pyramid = future.result()
+        self.pyramid_future = None
+        self._clear_tiles()
+        self._update_tiles()
+        self.preview_item.hide()
+
+    def _get_levels(self):
+        if self.levels is not None:
+            return self.levels
+        if self.image.dtype == np.uint8:
+            return 0, 255
+        # The smallest level (or the preview until there is a pyramid) is enough to find the range of the values
+        top = self.preview if self.pyramid is None else self.pyramid.levels[-1]
+        return float(np.nanmin(top)), float(np.nanmax(top))
+
+    def _map_tile(self, tile):
+        # Into RGB bytes, as if on a black background
+        low, high = self._get_levels()
+        scaled = np.subtract(tile, low, dtype=np.float32)
+        scaled *= 1 / (high - low) if high > low else 0
+        np.clip(scaled, 0, 1, out=scaled)
+        if len(tile.shape) == 2:
+            scaled *= 255
+            rgb = np.take(self.lut[:, :3], scaled.astype(np.uint8), axis=0)
+        else:
+            rgb = scaled[..., :3] * self.lut[0, 3]
+        rgb *= 255
+        return rgb.astype(np.uint8)
+
+    def _update_tiles(self):
+        if self.pyramid is None:
+            return
+
+        x_range, y_range = self.view_box.viewRange()
+        level = self.pyramid.level_for((x_range[1] - x_range[0]) / max(1., self.view_box.width()))
+        needed = set((level, row, column) for row, column in self.pyramid.tiles(level, x_range, y_range))
+
+        for key in list(self.tile_items.keys()):
+            if key not in needed:
+                self.view_box.removeItem(self.tile_items.pop(key))
+
+        scale = 2 ** level
+        for key in needed:
+            if key in self.tile_items:
+                continue
+            tile = self.tile_cache.get(key)
+            if tile is None:
+                tile = self._map_tile(self.pyramid.tile(*key))
+                self.tile_cache.put(key, tile)
+
+            _, row, column = key
+            item = pg.ImageItem(tile, levels=(0, 255), axisOrder='row-major')
+            item.setRect(QtCore.QRectF(column * self.pyramid.tile_size * scale, row * self.pyramid.tile_size * scale,
+                                       tile.shape[1] * scale, tile.shape[0] * scale))
+            self.view_box.addItem(item, ignoreBounds=True)
+            self.tile_items[key] = item
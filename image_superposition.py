@@ -0,0 +1,224 @@
+import numpy as np
+from pyqtgraph.widgets import RawImageWidget
+
+import colormaps
+import fingerprint as fp
+
+
+def _over(top, bottom, out):
+    # Alpha blending of premultiplied RGBA images. out can be bottom but not top
+    keep = 1 - top[..., 3:]
+    np.multiply(bottom, keep, out=out)
+    np.add(out, top, out=out)
+    return out
+
+
+class _Layer:
+    def __init__(self):
+        self.image = None
+        self.image_key = None
+        self.lut = colormaps.get_premultiplied_lut()
+        self.levels = None
+        self.is_dirty = True
+
+    def _get_image_key(self, image):
+        # Layers are often views into one array (e.g. list(data) of a 3D array) that are new objects every time, so
+        # arrays are told apart by where their data is and not by their identity
+        if isinstance(image, np.ndarray):
+            return (image.__array_interface__['data'][0], image.strides) + fp.array_fingerprint(image)[1:]
+        return fp.fingerprint(image)
+
+    def set_image(self, image, flip, version=None):
+        # version (see scheduler.get_version) is what tells in place changes that the fingerprint misses apart
+        image_key = self._get_image_key(image), flip, version
+        if image_key == self.image_key:
+            return
+        self.image_key = image_key
+
+        # The images are composited as they are and only the result gets transposed for the widget (which shows
+        # images as [x, y]), so the flips are the ones of the transposed image
+        image = np.asarray(image)
+        if flip == 'ud' or flip == 'udlr':
+            image = np.flipud(image)
+        if flip == 'lr' or flip == 'udlr':
+            image = np.fliplr(image)
+
+        self.image = image
+        self.is_dirty = True
+
+    def set_lut(self, lut, levels):
+        if lut is self.lut and levels == self.levels:
+            return
+        self.lut = lut
+        self.levels = levels
+        self.is_dirty = True
+
+    def _get_levels(self):
+        if self.levels is not None:
+            return self.levels
+        if self.image.dtype == np.uint8:
+            return 0, 255
+        return float(np.nanmin(self.image)), float(np.nanmax(self.image))
+
+    def _scale(self, values):
+        # To 0 - 1 between the levels
+        low, high = self._get_levels()
+        scaled = np.subtract(values, low, dtype=np.float32)
+        scaled *= 1 / (high - low) if high > low else 0
+        return np.clip(scaled, 0, 1, out=scaled)
+
+    def _lut_indices(self):
+        indices = self._scale(self.image)
+        indices *= 255
+        return indices.astype(np.uint8)
+
+    def constant_alpha(self):
+        # Single channel images get their alpha from the LUT (the opacity) so it is the same for all their pixels
+        if len(self.image.shape) == 2:
+            return float(self.lut[0, 3])
+        return None
+
+    def rgba(self, out):
+        # The layer as a premultiplied RGBA float image (into out), in a single pass through the LUT
+        if len(self.image.shape) == 2:
+            np.take(self.lut, self._lut_indices(), axis=0, out=out)
+        else:
+            # RGB(A) images keep their colours and only get the opacity from the LUT
+            out[..., :3] = self._scale(self.image[..., :3])
+            out[..., 3] = self.lut[0, 3]
+            if self.image.shape[2] > 3:
+                out[..., 3] *= self._scale(self.image[..., 3])
+            out[..., :3] *= out[..., 3:]
+        self.is_dirty = False
+        return out
+
+    def rgb(self, out):
+        # Only the premultiplied colours, for layers with a constant_alpha
+        np.take(self.lut[:, :3], self._lut_indices(), axis=0, out=out)
+        self.is_dirty = False
+        return out
+
+
+class StackedRawImageWidget:
+    # Shows a number of images on top of each other (the first at the bottom), each through its own LUT (see
+    # generate_luts). Everything that does not depend on the pixels of the last layer that changed (the composites of
+    # the layers below and above it) is kept, so when only that layer changes again (the usual case, e.g. the base
+    # image while the masks stay the same) it only gets put through its LUT and blended once, whatever the number of
+    # layers
+    def __init__(self, number_of_images=1):
+        self.number_of_images = number_of_images
+        self.layers = [_Layer() for _ in range(number_of_images)]
+        self.widget = RawImageWidget.RawImageWidget()
+
+        self.shape = None
+        self.active_layer = None
+        # For the active layer: 255 * the transparency of the layers above it, the layers below it as seen through
+        # the ones above and the layers above it (the last two times 255)
+        self.keep = None
+        self.below_kept = None
+        self.base = None
+        # base plus below_kept through the active layer's alpha, if that is constant
+        self.base_alpha = None
+        self.composite_base = None
+
+        self.layer_rgba = None
+        self.composite = None
+        self.output = None
+
+    @property
+    def scaled(self):
+        return self.widget.scaled
+
+    @scaled.setter
+    def scaled(self, scaled):
+        self.widget.scaled = scaled
+
+    def base_image(self):
+        return self.widget
+
+    def _per_layer(self, values):
+        if self.number_of_images == 1:
+            return [values]
+        if values is None:
+            return [None] * self.number_of_images
+        return list(values)
+
+    def generate_luts(self, levels, colormap_names, opacities):
+        for layer, layer_levels, colormap_name, opacity in zip(self.layers, self._per_layer(levels),
+                                                               self._per_layer(colormap_names),
+                                                               self._per_layer(opacities)):
+            layer.set_lut(colormaps.get_premultiplied_lut(colormap_name, opacity), colormaps.freeze(layer_levels))
+
+    def _allocate(self, shape):
+        if shape == self.shape:
+            return
+        self.shape = shape
+        self.keep = np.empty(shape + (1,), dtype=np.float32)
+        self.below_kept = np.empty(shape + (3,), dtype=np.float32)
+        self.base = np.empty(shape + (3,), dtype=np.float32)
+        self.composite_base = np.empty(shape + (3,), dtype=np.float32)
+        self.layer_rgba = np.empty(shape + (4,), dtype=np.float32)
+        self.composite = np.empty(shape + (3,), dtype=np.float32)
+        self.output = np.empty(shape + (3,), dtype=np.uint8)
+        self.active_layer = None
+
+    def _stack(self, layers):
+        stack = np.zeros(self.shape + (4,), dtype=np.float32)
+        for layer in layers:
+            _over(layer.rgba(self.layer_rgba), stack, out=stack)
+        return stack
+
+    def _set_active_layer(self, active_layer):
+        self.active_layer = active_layer
+        self.base_alpha = None
+
+        below = self._stack(self.layers[:active_layer])
+        above = self._stack(self.layers[active_layer + 1:])
+        np.subtract(1, above[..., 3:], out=self.keep)
+        self.keep *= 255
+        np.multiply(below[..., :3], self.keep, out=self.below_kept)
+        np.multiply(above[..., :3], 255, out=self.base)
+        # So that truncating to uint8 rounds
+        self.base += 0.5
+
+    def _recomposite(self):
+        dirty_layers = [i for i, layer in enumerate(self.layers) if layer.is_dirty]
+        if not dirty_layers:
+            return False
+
+        shape = self.layers[0].image.shape[:2]
+        if any(layer.image.shape[:2] != shape for layer in self.layers):
+            print('All the images to superimpose need to have the same x, y dimensions')
+            return False
+        self._allocate(shape)
+
+        if dirty_layers != [self.active_layer]:
+            self._set_active_layer(dirty_layers[-1])
+
+        layer = self.layers[self.active_layer]
+        alpha = layer.constant_alpha()
+        if alpha is not None:
+            if alpha != self.base_alpha:
+                np.multiply(self.below_kept, 1 - alpha, out=self.composite_base)
+                self.composite_base += self.base
+                self.base_alpha = alpha
+            layer.rgb(self.composite)
+            self.composite *= self.keep
+            self.composite += self.composite_base
+        else:
+            rgba = layer.rgba(self.layer_rgba)
+            np.multiply(rgba[..., :3], self.keep, out=self.composite)
+            self.composite += self.base
+            self.composite += self.below_kept * (1 - rgba[..., 3:])
+
+        np.copyto(self.output, self.composite, casting='unsafe')
+        return True
+
+    def assign_data(self, data, flips=None, version=None):
+        # data is an image (for a single image) or a list of images (with a flip each). A new version makes all the
+        # images count as changed
+        for layer, image, flip in zip(self.layers, self._per_layer(data), self._per_layer(flips)):
+            layer.set_image(image, flip, version)
+
+        if self._recomposite():
+            self.widget.setImage(np.transpose(self.output, [1, 0, 2]))
@@ -0,0 +1,82 @@
+import numpy as np
+
+
+def _is_unchanged(old_value, new_value):
+    # Arrays and other mutable objects can be changed in place and then assigned back to the same name, so only equal
+    # hashable (immutable) values of the same type are considered unchanged
+    if isinstance(old_value, np.ndarray) or isinstance(new_value, np.ndarray):
+        return False
+    if type(old_value) is not type(new_value):
+        return False
+    try:
+        hash(new_value)
+        return bool(old_value == new_value)
+    except Exception:
+        return False
+
+
+class ObservableNamespace(dict):
+    # A dict that can be used instead of globals() for the REPL (e.g. code.interact(local=namespace) or
+    # IPython.embed(user_ns=namespace)) and that tells its subscribers which variable got assigned or deleted.
+    # Subscribers are called with the variable name, in the thread that did the assignment.
+    def __init__(self, *args, **kwargs):
+        super(ObservableNamespace, self).__init__(*args, **kwargs)
+        self.subscribers = {}
+        self.versions = {}
+
+    def subscribe(self, callback, variable_name=None):
+        # A variable_name of None subscribes to changes of every variable
+        self.subscribers.setdefault(variable_name, []).append(callback)
+
+    def unsubscribe(self, callback, variable_name=None):
+        try:
+            self.subscribers[variable_name].remove(callback)
+        except (KeyError, ValueError):
+            pass
+
+    def touch(self, variable_name):
+        # For in place changes (e.g. namespace['data'][10:20] = 0) that do not go through an assignment
+        self._notify(variable_name)
+
+    def _notify(self, variable_name):
+        self.versions[variable_name] = self.versions.get(variable_name, 0) + 1
+        for callback in self.subscribers.get(variable_name, []) + self.subscribers.get(None, []):
+            callback(variable_name)
+
+    def __setitem__(self, key, value):
+        is_new = key not in self
+        old_value = self.get(key)
+        super(ObservableNamespace, self).__setitem__(key, value)
+        if is_new or not _is_unchanged(old_value, value):
+            self._notify(key)
+
+    def __delitem__(self, key):
+        super(ObservableNamespace, self).__delitem__(key)
+        self._notify(key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        is_present = key in self
+        value = super(ObservableNamespace, self).pop(key, *args)
+        if is_present:
+            self._notify(key)
+        return value
+
+    def popitem(self):
+        key, value = super(ObservableNamespace, self).popitem()
+        self._notify(key)
+        return key, value
+
+    def clear(self):
+        keys = list(self.keys())
+        super(ObservableNamespace, self).clear()
+        for key in keys:
+            self._notify(key)
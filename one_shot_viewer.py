@@ -1,5 +1,6 @@
 
 import sys
+from concurrent import futures
 from PyQt5 import QtWidgets, QtCore, QtGui
 
 import numpy as np
@@ -8,16 +9,29 @@ pg.setConfigOption('background', (250, 250, 250, 255))
 pg.setConfigOption('foreground', (0, 0, 0, 255))
 from pyqtgraph.widgets import RawImageWidget
 
-import matplotlib.pyplot as plt
-
 import uuid
 
 import image_superposition as ims
 
-import constants as ct
+import colormaps
+import decimation
+import density
+import fingerprint as fp
+import image_pyramid
+import scheduler
+import streaming as stream
 
 open_windows = {}
 
+_pyramid_executor = None
+
+
+def _get_pyramid_executor():
+    global _pyramid_executor
+    if _pyramid_executor is None:
+        _pyramid_executor = futures.ThreadPoolExecutor(max_workers=1)
+    return _pyramid_executor
+
 
 class AbstractOneShotGUI(QtWidgets.QWidget):
     def __init__(self):
@@ -30,9 +44,7 @@ class AbstractOneShotGUI(QtWidgets.QWidget):
         self.plotted_x_variable_name = None
         self.x_axis = None
 
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.on_timer_tick)
-        self.timer.start(ct.TIMER_UPDATE_TIME_MILLIS)
+        scheduler.register(self, self.on_timer_tick)
 
         self.layout_window = QtWidgets.QVBoxLayout()
         self.setLayout(self.layout_window)
@@ -40,23 +52,51 @@ class AbstractOneShotGUI(QtWidgets.QWidget):
         self.resize(800, 600)
 
     def closeEvent(self, event):
+        scheduler.unregister(self)
         del open_windows[self.uuid]
         self.close()
         event.accept()
 
+    def watched_variable_names(self):
+        return [self.plotted_y_variable_name, self.plotted_x_variable_name]
+
     def on_timer_tick(self):
         pass
 
 
 class GraphGUI(AbstractOneShotGUI):
-    def __init__(self, scatter):
+    # Emitted (from the thread that built it) with the future of a MinMaxPyramid once it is built
+    pyramid_built = QtCore.pyqtSignal(object)
+
+    def __init__(self, scatter, streaming=False, check_content=True, density_threshold=density.DENSITY_THRESHOLD,
+                 append=False, rolling_window=None):
         super(GraphGUI, self).__init__()
 
         self.data = None
+        self.connect = None
         self.stepmode = False
         self.fillLevel = None
         self.brush = (255, 255, 255, 255)
         self.scatter = scatter
+        self.streaming = streaming
+        self.pyramid = None
+        self.pyramid_future = None
+        self.pyramid_source = None
+        self.pyramid_base_block_size = decimation.PYRAMID_BASE_BLOCK_SIZE
+        self.streamed_plot_key = None
+
+        # What the data and the x axis were last loaded from. With check_content the whole content of arrays of up to
+        # fp.FULL_HASH_BYTES is compared too (only a few samples of bigger ones). If check_content is False only the
+        # identity, shape, dtype and version (see scheduler.touch) of the variables are, so in place changes need a
+        # touch
+        self.check_content = check_content
+        self.data_key = None
+        self.x_axis_key = None
+
+        # For arrays that only grow (along their last axis) only the new samples get copied
+        self.append_buffer = None
+        if append or rolling_window is not None:
+            self.append_buffer = stream.AppendBuffer(rolling_window)
 
         self.plot_widget = pg.PlotWidget()
         if scatter:
@@ -66,26 +106,169 @@ class GraphGUI(AbstractOneShotGUI):
         self.plot_data_item.setPen((0, 0, 0, 255))
         self.plot_widget.addItem(self.plot_data_item)
 
+        # Scatters with more than density_threshold points are binned at screen resolution and shown as an image
+        # that gets rebinned (once the view stops changing) when zooming or panning
+        self.density_threshold = density_threshold
+        self.is_density_shown = False
+        self.density_image_key = None
+        self.density_image = pg.ImageItem()
+        self.density_image.setLookupTable(density.density_lut())
+        self.density_image.hide()
+        self.plot_widget.addItem(self.density_image, ignoreBounds=True)
+        self.density_timer = QtCore.QTimer()
+        self.density_timer.setSingleShot(True)
+        self.density_timer.setInterval(50)
+        self.density_timer.timeout.connect(self._update_density_image)
+        view_box = self.plot_widget.getViewBox()
+        view_box.sigRangeChanged.connect(self._on_view_changed)
+        view_box.sigResized.connect(self._on_view_changed)
+
+        # Streamed memmaps get decimated again for the range in view once zooming or panning stops for a moment
+        self.streamed_timer = QtCore.QTimer()
+        self.streamed_timer.setSingleShot(True)
+        self.streamed_timer.setInterval(50)
+        self.streamed_timer.timeout.connect(self._update_streamed_plot)
+        self.pyramid_built.connect(self._on_pyramid_built)
+
         self.layout_window.insertWidget(0, self.plot_widget)
 
+    def _get_variable_key(self, variable_name):
+        if variable_name is None:
+            return None
+        value = self.repl_globals.get(variable_name)
+        if isinstance(value, np.ndarray) and not self.check_content:
+            value_key = id(value), value.shape, value.dtype.str
+        else:
+            value_key = fp.fingerprint(value)
+        return scheduler.get_version(self.repl_globals, variable_name), value_key
+
     def _load_data(self):
+        # Returns False if the y variable has not changed since the last load
         try:
             temp = self.repl_globals[self.plotted_y_variable_name]
         except KeyError:
             print('Y axis variable to plot {} not defined in the REPL'.format(self.plotted_y_variable_name))
             self.close()
+            return False
 
-        if type(temp).__name__ == 'memmap':
+        data_key = self._get_variable_key(self.plotted_y_variable_name)
+        if data_key == self.data_key:
+            return False
+        self.data_key = data_key
+
+        if self.streaming and isinstance(temp, np.memmap):
+            self.data = temp
+        elif type(temp).__name__ == 'memmap':
             self.data = temp[:]
+        elif self.append_buffer is not None and np.ndim(temp) in (1, 2):
+            self.append_buffer.update(np.asarray(temp))
+            self.data = self.append_buffer.data
+        elif type(self.data) is np.ndarray and isinstance(temp, np.ndarray) and \
+                temp.shape == self.data.shape and temp.dtype == self.data.dtype:
+            # Only the values changed so the old buffer gets reused
+            np.copyto(self.data, temp)
         else:
             self.data = np.array(temp)
+        return True
+
+    def _is_streamed(self):
+        return self.streaming and isinstance(self.data, np.memmap) and not self.scatter
+
+    def _build_pyramid(self):
+        # The memmap gets read once in chunks, in the background, to build a min/max pyramid. Until that is done the
+        # plot gets drawn from the samples in view (or, for large ranges, only every so many of them)
+        if self.pyramid_source is self.data:
+            return
+        self.pyramid = None
+        self.pyramid_source = self.data
+        # Blocks big enough for the pyramid to stay within decimation.STREAMED_PYRAMID_MAX_BYTES whatever the size of
+        # the memmap. Ranges with fewer than about a block per bin get read straight from the memmap
+        self.pyramid_base_block_size = decimation.base_block_size_for(self.data)
+        self.pyramid_future = _get_pyramid_executor().submit(decimation.MinMaxPyramid, self.data,
+                                                             self.pyramid_base_block_size)
+        self.pyramid_future.add_done_callback(self.pyramid_built.emit)
+
+    def _on_pyramid_built(self, future):
+        if future is not self.pyramid_future or future.exception() is not None:
+            return
+        self.pyramid = future.result()
+        self.pyramid_future = None
+        self.streamed_plot_key = None
+        self._update_streamed_plot()
+
+    def _get_streamed_range(self, x):
+        # The samples in view. While the view follows the data (auto range) that is all of them
+        number_of_samples = self.data.shape[-1]
+        view_box = self.plot_widget.getViewBox()
+        if view_box.autoRangeEnabled()[0]:
+            return 0, number_of_samples
+        x_range = view_box.viewRange()[0]
+        if x is None:
+            start, stop = int(np.floor(x_range[0])), int(np.ceil(x_range[1])) + 1
+        else:
+            # The x variable needs to be increasing
+            start, stop = np.searchsorted(x, x_range[0]) - 1, np.searchsorted(x, x_range[1]) + 1
+        start = min(max(0, start), number_of_samples - 1)
+        return start, min(max(start + 1, stop), number_of_samples)
+
+    def _decimate_streamed(self, start, stop, number_of_bins):
+        decimated = None
+        if self.pyramid is not None:
+            decimated = self.pyramid.query(start, stop, number_of_bins)
+        if decimated is None and stop - start <= number_of_bins * self.pyramid_base_block_size:
+            decimated = decimation.minmax_decimate(np.asarray(self.data[..., start:stop]), number_of_bins)
+        if decimated is None:
+            step = (stop - start) // number_of_bins
+            y = np.atleast_2d(np.asarray(self.data[..., start:stop:step]))
+            decimated = np.arange(y.shape[-1]) * step, y
+        x, y = decimated
+        return x + start, y
+
+    def _update_streamed_plot(self):
+        # The memmap is never read into memory, only about 2 points per horizontal pixel of the range in view are
+        # plotted
+        if not self._is_streamed():
+            return
+        self._build_pyramid()
+
+        x = None
+        if self.plotted_x_variable_name is not None:
+            try:
+                x = np.asarray(self.repl_globals[self.plotted_x_variable_name])
+            except KeyError:
+                print('X axis variable to plot {} not defined in the REPL'.format(
+                    self.plotted_x_variable_name))
+                self.close()
+                return
+
+        number_of_bins = max(1, self.plot_widget.width())
+        start, stop = self._get_streamed_range(x)
+        streamed_plot_key = (start, stop, number_of_bins, self.data_key, self.x_axis_key)
+        if streamed_plot_key == self.streamed_plot_key:
+            return
+        self.streamed_plot_key = streamed_plot_key
+
+        indices, y = self._decimate_streamed(start, stop, number_of_bins)
+        x = indices if x is None else x[indices]
+        x, y, connect = decimation.to_plot_data(x, y)
+        self.plot_data_item.opts['connect'] = connect
+        self.plot_data_item.setData(x=x, y=y)
+
+    def _is_appended(self):
+        return self.append_buffer is not None and self.data is not None and \
+            self.data.base is self.append_buffer.buffer
 
     def _setup_x_axis(self):
         if self.plotted_x_variable_name is None:
+            if self._is_appended():
+                # The indices of the samples in the appended array (so the x axis scrolls with a rolling window)
+                x_axis = self.append_buffer.indices()
+            else:
+                x_axis = np.arange(self.data.shape[-1])
             if len(self.data.shape) == 1:
-                self.x_axis = np.arange(self.data.shape[0])
+                self.x_axis = x_axis
             if len(self.data.shape) == 2:
-                self.x_axis = np.tile(np.arange(self.data.shape[1]), self.data.shape[0])
+                self.x_axis = np.tile(x_axis, self.data.shape[0])
         else:
             try:
                 self.x_axis = np.array(self.repl_globals[self.plotted_x_variable_name])
@@ -93,6 +276,9 @@ class GraphGUI(AbstractOneShotGUI):
                 print('X axis variable to plot {} not defined in the REPL'.format(
                     self.plotted_x_variable_name))
                 self.close()
+            if self._is_appended():
+                # Only the part of the x axis that corresponds to the rolling window
+                self.x_axis = self.x_axis[self.append_buffer.start:]
             if len(self.data.shape) == 1:
                 if len(self.data) == len(self.x_axis):
                     self.stepmode = False
@@ -117,7 +303,72 @@ class GraphGUI(AbstractOneShotGUI):
                           .format(self.x_axis.shape[0], self.data.shape[-1]))
                     self.close()
 
+        if len(self.data.shape) == 2:
+            # The connect argument allows a single line to be broken up (see pg.ArrayToQPath) so that the
+            # 1D array data[index, :, :].flatten() shows up as multiple independent lines
+            self.connect = np.ones(len(self.x_axis))
+            self.connect[np.arange(self.data.shape[1] - 1, self.data.shape[1] * self.data.shape[0],
+                                   self.data.shape[1])] = 0
+
+    def _should_show_density(self):
+        return self.scatter and self.density_threshold is not None and \
+            np.size(self.data) > self.density_threshold and np.size(self.x_axis) == np.size(self.data)
+
+    def _show_density(self, is_density_shown):
+        if is_density_shown == self.is_density_shown:
+            return
+        self.is_density_shown = is_density_shown
+        self.density_image_key = None
+        if is_density_shown:
+            self.plot_data_item.clear()
+            self.plot_data_item.hide()
+            self.density_image.show()
+        else:
+            self.density_image.hide()
+            self.density_image.clear()
+            self.plot_data_item.show()
+
+    def _update_density_plot(self):
+        self._show_density(True)
+
+        # The image is ignored by the auto range so the view gets fitted to the data here
+        view_box = self.plot_widget.getViewBox()
+        if all(view_box.autoRangeEnabled()):
+            view_box.setRange(xRange=density.data_range(self.x_axis), yRange=density.data_range(self.data.ravel()),
+                              disableAutoRange=False)
+        self._update_density_image()
+
+    def _update_density_image(self):
+        if not self.is_density_shown:
+            return
+        view_box = self.plot_widget.getViewBox()
+        x_range, y_range = view_box.viewRange()
+        width = int(view_box.width())
+        height = int(view_box.height())
+
+        density_image_key = (tuple(x_range), tuple(y_range), width, height, self.data_key, self.x_axis_key)
+        if density_image_key == self.density_image_key:
+            return
+        self.density_image_key = density_image_key
+
+        counts = density.density_raster(self.x_axis, self.data, x_range, y_range, width, height)
+        image = np.log1p(counts, dtype=np.float32)
+        self.density_image.setImage(image, levels=(0, max(float(image.max()), 1.)))
+        self.density_image.setRect(QtCore.QRectF(x_range[0], y_range[0], x_range[1] - x_range[0],
+                                                 y_range[1] - y_range[0]))
+
+    def _on_view_changed(self, *args):
+        if self.is_density_shown:
+            self.density_timer.start()
+        if self._is_streamed():
+            self.streamed_timer.start()
+
     def _update_plot(self):
+        if self._should_show_density():
+            self._update_density_plot()
+            return
+        self._show_density(False)
+
         if len(np.shape(self.data)) == 1:
             if self.fillLevel is None:
                 self.plot_data_item.setData(self.x_axis, self.data, stepMode=self.stepmode, brush=self.brush)
@@ -126,29 +377,36 @@ class GraphGUI(AbstractOneShotGUI):
                                             fillLevel=self.fillLevel, brush=self.brush)
 
         elif len(np.shape(self.data)) == 2:
+            self.plot_data_item.opts['connect'] = self.connect
 
-            # The connect argument allows a single line to be broken up (see pg.ArrayToQPath) so that the
-            # 1D array data[index, :, :].flatten() shows up as multiple independent lines
-            connect = np.ones(len(self.x_axis))
-            connect[np.arange(self.data.shape[1] - 1, self.data.shape[1] * self.data.shape[0], self.data.shape[1])] = 0
-            self.plot_data_item.opts['connect'] = connect
-
-            y = self.data.flatten()
+            y = self.data.ravel()
             self.plot_data_item.setData(x=self.x_axis, y=y)
 
     def on_timer_tick(self):
         if self.repl_globals is not None:
 
-            self._load_data()
+            is_data_changed = self._load_data()
+
+            # The x axis only gets rebuilt (and tiled) if the x variable, the data shape or the rolling window changed
+            x_axis_key = (np.shape(self.data), self._get_variable_key(self.plotted_x_variable_name),
+                          self.append_buffer.start if self._is_appended() else None)
+            is_x_axis_changed = x_axis_key != self.x_axis_key
+            if not is_data_changed and not is_x_axis_changed:
+                return
+            self.x_axis_key = x_axis_key
+
+            if self._is_streamed():
+                self._update_streamed_plot()
+                return
 
-            #if self.x_axis is None or self.scatter is True:
-            self._setup_x_axis()
+            if is_x_axis_changed:
+                self._setup_x_axis()
 
             self._update_plot()
 
 
 class ImageGUI(AbstractOneShotGUI):
-    def __init__(self, num_of_images=1):
+    def __init__(self, num_of_images=1, tiled=None, cache_directory=None):
         super(ImageGUI, self).__init__()
 
         self.num_of_images = num_of_images
@@ -159,11 +417,23 @@ class ImageGUI(AbstractOneShotGUI):
         self.opacities_name = None
         self.flips_name = None
 
+        # The levels, colormaps and opacities the LUTs were last generated for
+        self.luts_key = None
+
         self.image_widget = ims.StackedRawImageWidget(self.num_of_images)
         self.image_widget.scaled = True
 
+        # Big single images are shown a tile at a time through an image_pyramid.TiledImageWidget (made when needed)
+        self.tiled = tiled
+        self.cache_directory = cache_directory
+        self.tiled_widget = None
+
         self.layout_window.insertWidget(0, self.image_widget.base_image())
 
+    def watched_variable_names(self):
+        return [self.plotted_y_variable_name, self.image_levels_name, self.colormaps_name, self.opacities_name,
+                self.flips_name]
+
     def _load_data(self):
         try:
             self.data = self.repl_globals[self.plotted_y_variable_name]
@@ -227,40 +497,26 @@ class ImageGUI(AbstractOneShotGUI):
                                                                             'flips is not the same as the' \
                                                                             'number of images'
 
-    def _do_flip(self, data, flip):
-        if flip == 'ud' or flip == 'udlr':
-            data = np.fliplr(data)
-        if flip == 'lr' or flip == 'udlr':
-            data = np.flipud(data)
-
-        return data
+    def _is_tiled(self):
+        if self.num_of_images != 1 or not isinstance(self.data, np.ndarray) or len(self.data.shape) < 2:
+            return False
+        if self.tiled is None:
+            return self.data.shape[0] * self.data.shape[1] > image_pyramid.TILED_IMAGE_PIXELS
+        return self.tiled
+
+    def _update_tiled_plot(self):
+        if self.tiled_widget is None:
+            self.tiled_widget = image_pyramid.TiledImageWidget(cache_directory=self.cache_directory)
+            self.layout_window.insertWidget(0, self.tiled_widget)
+        self.image_widget.base_image().hide()
+        self.tiled_widget.show()
+        version = scheduler.get_version(self.repl_globals, self.plotted_y_variable_name)
+        self.tiled_widget.set_image(self.data, self.image_levels, self.colormaps, self.opacities, self.flips, version)
 
     def _update_plot(self):
-
-        if self.num_of_images == 1:
-            data = self.data
-            if len(data.shape) == 2:
-                data = np.transpose(data)
-            elif len(data.shape) == 3:
-                data = np.transpose(data, [1, 0, 2])
-            if self.flips is not None:
-                data = self._do_flip(data, self.flips)
-
-        else:
-            data = list(self.data).copy()
-            for f in np.arange(self.num_of_images):
-                if len(data[f].shape) == 2:
-                    data[f] = np.transpose(data[f])
-                    if self.flips is not None:
-                        data[f] = self._do_flip(data[f], self.flips)
-                elif len(data[f].shape) == 3:
-                    data[f] = np.transpose(data[f], [1, 0, 2])
-
-                if self.flips is not None:
-                    if self.flips[f] is not None:
-                        data[f] = self._do_flip(data[f], self.flips[f])
-
-        self.image_widget.assign_data(data)
+        # The widget transposes and flips the images itself and only for the ones that changed
+        version = scheduler.get_version(self.repl_globals, self.plotted_y_variable_name)
+        self.image_widget.assign_data(self.data, self.flips, version)
 
     def on_timer_tick(self):
         if self.repl_globals is not None:
@@ -271,7 +527,18 @@ class ImageGUI(AbstractOneShotGUI):
             self._update_colormaps()
             self._update_opacities()
             self._update_flips()
-            self.image_widget.generate_luts(self.image_levels, self.colormaps, self.opacities)
+
+            if self._is_tiled():
+                self._update_tiled_plot()
+                return
+            if self.tiled_widget is not None and not self.tiled_widget.isHidden():
+                self.tiled_widget.hide()
+                self.image_widget.base_image().show()
+
+            luts_key = colormaps.freeze((self.image_levels, self.colormaps, self.opacities))
+            if luts_key != self.luts_key:
+                self.image_widget.generate_luts(self.image_levels, self.colormaps, self.opacities)
+                self.luts_key = luts_key
 
             self._update_plot()
 
@@ -280,8 +547,16 @@ if QtWidgets.QApplication.instance() is None:
     app = QtWidgets.QApplication(sys.argv)
 
 
-def graph(repl_globals, plotted_y_variable_name, plotted_x_variable_name=None, scatter=False):
-    win = GraphGUI(scatter)
+def graph(repl_globals, plotted_y_variable_name, plotted_x_variable_name=None, scatter=False, streaming=False,
+          check_content=True, density_threshold=density.DENSITY_THRESHOLD, append=False, rolling_window=None):
+    # The plot is only redrawn when the y or x variable changed. In place changes are always seen for arrays of up to
+    # fingerprint.FULL_HASH_BYTES, but only if they hit a sampled element for bigger ones. With check_content=False
+    # changes are only looked for in the identity, shape and dtype of the variables (much cheaper for big arrays), so
+    # in place changes need a scheduler.touch(repl_globals, variable_name)
+    # Scatter plots with more than density_threshold points are drawn as a density image (None to never do that)
+    # With append=True a y variable that keeps growing (e.g. with np.append) only gets its new samples copied each time.
+    # A rolling_window (number of samples) also turns that on and only shows the latest rolling_window samples
+    win = GraphGUI(scatter, streaming, check_content, density_threshold, append, rolling_window)
     open_windows[win.uuid] = win
     win.repl_globals = repl_globals
     win.plotted_y_variable_name = plotted_y_variable_name
@@ -291,9 +566,11 @@ def graph(repl_globals, plotted_y_variable_name, plotted_x_variable_name=None, s
 
 def image(repl_globals, plotted_y_variable_name,
           image_levels_name=None, colormaps_name=None, opacities_name=None, flips_name=None,
-          number_of_images=1):
-
-    win = ImageGUI(num_of_images=number_of_images)
+          number_of_images=1, tiled=None, cache_directory=None):
+    # A single image with more than image_pyramid.TILED_IMAGE_PIXELS pixels (or any single image if tiled=True) gets
+    # shown through an image pyramid that only draws the tiles in view, at the level that matches the zoom. The
+    # pyramids of memmapped images can be kept in (and reused from) a cache_directory
+    win = ImageGUI(num_of_images=number_of_images, tiled=tiled, cache_directory=cache_directory)
     open_windows[win.uuid] = win
     win.repl_globals = repl_globals
     win.plotted_y_variable_name = plotted_y_variable_name
@@ -0,0 +1,34 @@
+from collections import OrderedDict
+
+
+# Off by default. The scheduler already skips inputs that did not change, and the key is a hash of all of the input
+DEFAULT_OUTPUT_CACHE_SIZE = 0
+
+
+class OutputCache:
+    # Least recently used cache of at most max_size results
+    def __init__(self, max_size=DEFAULT_OUTPUT_CACHE_SIZE):
+        self.max_size = max_size
+        self.outputs = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        # Returns (True, output) or (False, None) since None is a valid output
+        if key is None or key not in self.outputs:
+            self.misses += 1
+            return False, None
+        self.outputs.move_to_end(key)
+        self.hits += 1
+        return True, self.outputs[key]
+
+    def put(self, key, output):
+        if key is None or self.max_size < 1:
+            return
+        self.outputs[key] = output
+        self.outputs.move_to_end(key)
+        while len(self.outputs) > self.max_size:
+            self.outputs.popitem(last=False)
+
+    def clear(self):
+        self.outputs.clear()
@@ -0,0 +1,53 @@
+import time
+from collections import deque
+
+
+DEFAULT_FPS = 25
+STATISTICS_SECONDS = 1
+
+
+class PlaybackClock:
+    # Says which frame should be showing now, going by a monotonic clock from when the playback started and the fps
+    # times the speed, so the playback runs at the same rate however long each frame takes to show. Frames that there
+    # was no time to show get skipped and counted as dropped.
+    def __init__(self, fps=DEFAULT_FPS, speed=1.):
+        self.fps = fps
+        self.speed = speed
+
+        self.start_index = 0
+        self.start_time = None
+        self.last_index = None
+        self.dropped_frames = 0
+        self.shown_times = deque()
+
+    def frame_rate(self):
+        return self.fps * self.speed
+
+    def start(self, index):
+        self.start_index = index
+        self.start_time = time.monotonic()
+        self.last_index = index
+        self.dropped_frames = 0
+        self.shown_times.clear()
+
+    def target_index(self):
+        return self.start_index + int((time.monotonic() - self.start_time) * self.frame_rate())
+
+    def frame_shown(self, index):
+        if self.last_index is not None and index > self.last_index + 1:
+            self.dropped_frames += index - self.last_index - 1
+        self.last_index = index
+
+        now = time.monotonic()
+        self.shown_times.append(now)
+        while now - self.shown_times[0] > STATISTICS_SECONDS:
+            self.shown_times.popleft()
+
+    def achieved_fps(self):
+        # Over the last STATISTICS_SECONDS
+        if len(self.shown_times) < 2:
+            return 0.
+        return (len(self.shown_times) - 1) / (self.shown_times[-1] - self.shown_times[0])
+
+    def report(self):
+        return '{:.1f} / {:.1f} fps, {} dropped'.format(self.achieved_fps(), self.frame_rate(), self.dropped_frames)
@@ -0,0 +1,26 @@
+import numpy as np
+
+
+class LineGeometry:
+    # The x, connect and y arrays needed to show a (channels, points) array as independent lines with a single
+    # pg.PlotDataItem. They are allocated once and the y values of every new frame are copied into the same buffer.
+    def __init__(self, x, number_of_channels):
+        number_of_points = len(x)
+
+        self.x = np.tile(x, number_of_channels)
+
+        # The connect argument allows a single line to be broken up (see pg.ArrayToQPath) so that the flattened
+        # channels show up as multiple independent lines
+        self.connect = np.ones(self.x.size, dtype=bool)
+        if number_of_points > 0:
+            self.connect[number_of_points - 1::number_of_points] = False
+
+        self.y_buffer = np.empty((number_of_channels, number_of_points))
+        self.y = self.y_buffer.reshape(-1)
+
+    def fits(self, y):
+        return np.size(y) == self.y.size
+
+    def fill(self, y):
+        np.copyto(self.y_buffer, np.reshape(y, self.y_buffer.shape))
+        return self.y
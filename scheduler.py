@@ -0,0 +1,250 @@
+import time
+import traceback
+
+from PyQt5 import QtCore
+
+import constants as ct
+import fingerprint as fp
+from observable_namespace import ObservableNamespace
+
+
+class _Registration:
+    def __init__(self, window, callback):
+        self.window = window
+        self.callback = callback
+        self.seen_fingerprints = None
+        self.is_dirty = True
+        self.last_update_duration = 0
+
+    def repl_globals(self):
+        return getattr(self.window, 'repl_globals', None)
+
+    def watched_variable_names(self):
+        # Windows that do not say what they watch get updated on every tick (the old polling behaviour)
+        try:
+            names = self.window.watched_variable_names()
+        except AttributeError:
+            return None
+        return [name for name in names if name is not None]
+
+    def output_variable_names(self):
+        try:
+            names = self.window.output_variable_names()
+        except AttributeError:
+            return []
+        return [name for name in names if name is not None]
+
+    def is_event_driven(self):
+        return isinstance(self.repl_globals(), ObservableNamespace) and self.watched_variable_names() is not None
+
+
+class Scheduler(QtCore.QObject):
+    # Emitted by the ObservableNamespace subscription. Going through a signal means that assignments done in other
+    # threads still get handled in the GUI thread
+    variable_changed = QtCore.pyqtSignal(object, object)
+
+    def __init__(self):
+        super(Scheduler, self).__init__()
+
+        self.registrations = {}
+        self.versions = {}
+        self.observed_namespaces = {}
+        self.reported_cycles = set()
+        self.is_flush_scheduled = False
+
+        self.variable_changed.connect(self.on_variable_changed)
+
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.on_timer_tick)
+        self.timer.start(ct.TIMER_UPDATE_TIME_MILLIS)
+
+    def register(self, window, callback):
+        self.registrations[window.uuid] = _Registration(window, callback)
+        # Event driven windows need a first update without waiting for a change
+        self.schedule_flush()
+        if not self.timer.isActive():
+            self.timer.start(ct.TIMER_UPDATE_TIME_MILLIS)
+
+    def unregister(self, window):
+        self.registrations.pop(window.uuid, None)
+
+    def mark_dirty(self, window):
+        try:
+            self.registrations[window.uuid].is_dirty = True
+        except KeyError:
+            return
+        self.schedule_flush()
+
+    def touch(self, repl_globals, variable_name):
+        # For in place changes (e.g. data[10:20] = 0) that the fingerprint of the variable might not catch
+        if isinstance(repl_globals, ObservableNamespace):
+            repl_globals.touch(variable_name)
+            return
+        key = (id(repl_globals), variable_name)
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def get_version(self, repl_globals, variable_name):
+        # Goes up every time the variable is touched (or, in an ObservableNamespace, assigned)
+        if isinstance(repl_globals, ObservableNamespace):
+            return repl_globals.versions.get(variable_name, 0)
+        return self.versions.get((id(repl_globals), variable_name), 0)
+
+    def schedule_flush(self):
+        if not self.is_flush_scheduled:
+            self.is_flush_scheduled = True
+            QtCore.QTimer.singleShot(0, self.on_scheduled_flush)
+
+    def _observe(self, repl_globals):
+        if id(repl_globals) not in self.observed_namespaces:
+            self.observed_namespaces[id(repl_globals)] = repl_globals
+            repl_globals.subscribe(lambda variable_name: self.variable_changed.emit(repl_globals, variable_name))
+
+    def on_variable_changed(self, repl_globals, variable_name):
+        for registration in self.registrations.values():
+            if registration.repl_globals() is repl_globals and \
+                    variable_name in (registration.watched_variable_names() or []):
+                registration.is_dirty = True
+                self.schedule_flush()
+
+    def _variable_fingerprint(self, repl_globals, variable_name):
+        version = self.get_version(repl_globals, variable_name)
+        try:
+            value = repl_globals[variable_name]
+        except KeyError:
+            return version, None
+        return version, fp.fingerprint(value)
+
+    def _needs_update(self, registration, fingerprints):
+        repl_globals = registration.repl_globals()
+        if repl_globals is None:
+            return False
+
+        names = registration.watched_variable_names()
+        if names is None:
+            return True
+
+        if isinstance(repl_globals, ObservableNamespace):
+            self._observe(repl_globals)
+            is_dirty = registration.is_dirty
+            registration.is_dirty = False
+            return is_dirty
+
+        current_fingerprints = {}
+        for name in names:
+            key = (id(repl_globals), name)
+            if key not in fingerprints:
+                fingerprints[key] = self._variable_fingerprint(repl_globals, name)
+            current_fingerprints[name] = fingerprints[key]
+
+        if registration.is_dirty or current_fingerprints != registration.seen_fingerprints:
+            registration.seen_fingerprints = current_fingerprints
+            registration.is_dirty = False
+            return True
+        return False
+
+    def _topologically_sorted(self):
+        # Windows that write a variable (e.g. transforms) come before the windows that watch it, so that a change
+        # goes through a whole chain of windows in a single flush. Windows in a cycle keep their registration order.
+        registrations = list(self.registrations.values())
+        producers = {}
+        for registration in registrations:
+            for name in registration.output_variable_names():
+                producers.setdefault((id(registration.repl_globals()), name), []).append(registration)
+
+        downstream = {registration.window.uuid: [] for registration in registrations}
+        number_of_upstream = {registration.window.uuid: 0 for registration in registrations}
+        for registration in registrations:
+            for name in registration.watched_variable_names() or []:
+                for producer in producers.get((id(registration.repl_globals()), name), []):
+                    if producer is not registration:
+                        downstream[producer.window.uuid].append(registration)
+                        number_of_upstream[registration.window.uuid] += 1
+
+        ready = [registration for registration in registrations if number_of_upstream[registration.window.uuid] == 0]
+        sorted_registrations = []
+        while ready:
+            registration = ready.pop(0)
+            sorted_registrations.append(registration)
+            for consumer in downstream[registration.window.uuid]:
+                number_of_upstream[consumer.window.uuid] -= 1
+                if number_of_upstream[consumer.window.uuid] == 0:
+                    ready.append(consumer)
+
+        in_cycle = [registration for registration in registrations if registration not in sorted_registrations]
+        if in_cycle:
+            cycle = frozenset(registration.window.uuid for registration in in_cycle)
+            if cycle not in self.reported_cycles:
+                self.reported_cycles.add(cycle)
+                print('The windows writing {} depend on each other in a cycle so they will update in the order they '
+                      'were opened'.format(sorted(set(name for registration in in_cycle
+                                                      for name in registration.output_variable_names()))))
+
+        return sorted_registrations + in_cycle
+
+    def _update_timer(self):
+        # Polling is only needed while there are windows that are not on an ObservableNamespace
+        if all(registration.is_event_driven() for registration in self.registrations.values()):
+            self.timer.stop()
+        elif not self.timer.isActive():
+            self.timer.start(ct.TIMER_UPDATE_TIME_MILLIS)
+
+    def flush(self):
+        fingerprints = {}
+        for registration in self._topologically_sorted():
+            # A previous callback in this flush might have closed the window
+            if registration.window.uuid not in self.registrations:
+                continue
+            if not self._needs_update(registration, fingerprints):
+                continue
+
+            start = time.perf_counter()
+            try:
+                registration.callback()
+            except Exception:
+                traceback.print_exc()
+            registration.last_update_duration = time.perf_counter() - start
+
+            # So that the windows downstream see what this one just wrote
+            repl_globals = registration.repl_globals()
+            for name in registration.output_variable_names():
+                fingerprints.pop((id(repl_globals), name), None)
+
+        self._update_timer()
+
+    def on_scheduled_flush(self):
+        self.is_flush_scheduled = False
+        self.flush()
+
+    def on_timer_tick(self):
+        self.flush()
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    # Created lazily so that the QApplication exists before the QTimer does
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
+
+
+def register(window, callback):
+    get_scheduler().register(window, callback)
+
+
+def unregister(window):
+    get_scheduler().unregister(window)
+
+
+def mark_dirty(window):
+    get_scheduler().mark_dirty(window)
+
+
+def touch(repl_globals, variable_name):
+    get_scheduler().touch(repl_globals, variable_name)
+
+
+def get_version(repl_globals, variable_name):
+    return get_scheduler().get_version(repl_globals, variable_name)
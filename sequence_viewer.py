@@ -1,21 +1,46 @@
 
 import sys
+import time
+from concurrent import futures
 from PyQt5 import QtWidgets, QtCore
 
 import numpy as np
 import pyqtgraph as pg
 from pyqtgraph.widgets import RawImageWidget
 
-import matplotlib.pyplot as plt
-
 import uuid
 
-import cv2
-
-import constants as ct
+import colormaps
+import compositing
+import decimation
+import fingerprint as fp
+import frame_cache
+import output_cache
+import playback
+import plot_geometry
+import scheduler
+import streaming
 
 open_windows = {}
 
+PANE_CACHE_SIZE = 32
+PREFETCHED_PANES = 2
+LIVE_UPDATE_TIME_MILLIS = 33
+FRAME_RETRY_TIME_MILLIS = 100
+
+_pane_transform_executor = None
+
+
+def _get_pane_transform_executor():
+    global _pane_transform_executor
+    if _pane_transform_executor is None:
+        _pane_transform_executor = futures.ThreadPoolExecutor(max_workers=1)
+    return _pane_transform_executor
+
+
+def _transform_pane(data, transform, index):
+    return transform(np.asarray(data[index]))
+
 
 class AbstractSequencerGUI(QtWidgets.QWidget):
     def __init__(self):
@@ -35,10 +60,9 @@ class AbstractSequencerGUI(QtWidgets.QWidget):
         self.text_is_being_edited = False
         self.transform_name = None
         self.transform = None
+        self.plot_state = None
 
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.on_timer_tick)
-        self.timer.start(ct.TIMER_UPDATE_TIME_MILLIS)
+        scheduler.register(self, self.on_timer_tick)
 
         self.layout_window = QtWidgets.QVBoxLayout()
         self.setLayout(self.layout_window)
@@ -75,6 +99,7 @@ class AbstractSequencerGUI(QtWidgets.QWidget):
         self.resize(800, 600)
 
     def closeEvent(self, event):
+        scheduler.unregister(self)
         del open_windows[self.uuid]
         self.close()
         event.accept()
@@ -107,9 +132,26 @@ class AbstractSequencerGUI(QtWidgets.QWidget):
     def on_slider_change(self):
         self.repl_globals[self.tracker_variable_name] = int(self.slider_position.value())
 
+    def watched_variable_names(self):
+        return [self.tracker_variable_name, self.plotted_y_variable_name, self.plotted_x_variable_name,
+                self.transform_name]
+
     def on_timer_tick(self):
         pass
 
+    def _get_plot_state(self):
+        return self.index, id(self.data), id(self.transform)
+
+    def _update_plot(self):
+        pass
+
+    def _update_plot_if_changed(self):
+        # Redraw only when something the plot depends on has changed since the last time it was drawn
+        plot_state = self._get_plot_state()
+        if plot_state != self.plot_state:
+            self.plot_state = plot_state
+            self._update_plot()
+
     def _update_index(self):
         try:
             self.index = self.repl_globals[self.tracker_variable_name]
@@ -131,6 +173,18 @@ class GraphPaneGUI(AbstractSequencerGUI):
         self.fillLevel = None
         self.brush = (255, 255, 255, 255)
 
+        self.streaming = False
+        self.read_ahead = 0
+        self.streaming_axis = 0
+        self.reader = None
+
+        # Transformed panes, and the ones being transformed in the background, for the prefetched_panes panes on
+        # either side of the current one
+        self.prefetched_panes = PREFETCHED_PANES
+        self.pane_cache = output_cache.OutputCache(PANE_CACHE_SIZE)
+        self.pane_calculations = {}
+        self.pane_cache_state = None
+
         self.plot_widget = pg.PlotWidget()
         self.plot_data_item = pg.PlotDataItem()
         self.plot_widget.addItem(self.plot_data_item)
@@ -144,7 +198,14 @@ class GraphPaneGUI(AbstractSequencerGUI):
             print('Y axis variable to plot {} not defined in the REPL'.format(self.plotted_y_variable_name))
             self.close()
 
-        if type(temp).__name__ == 'memmap':
+        if isinstance(temp, streaming.RingBufferSource):
+            # A live source that only the latest samples get read from (see GraphRangeGUI)
+            self.data = temp
+        elif self.streaming and isinstance(temp, np.memmap):
+            # Leave the memmap on disk and only read the part that is shown (see _read_data)
+            self.data = temp
+            self.reader = streaming.MemmapWindowReader(temp, axis=self.streaming_axis, read_ahead=self.read_ahead)
+        elif type(temp).__name__ == 'memmap':
             self.data = temp[:]
         else:
             self.data = np.array(temp)
@@ -192,11 +253,63 @@ class GraphPaneGUI(AbstractSequencerGUI):
                 # example: t = [0,1,2,3] for data.shape=(i, 2, 4) becomes t = [0, 1, 2, 3, 0, 1, 2, 3, 4]
                 self.x_axis = np.tile(self.x_axis, self.data.shape[1])
 
+    def _read_data(self):
+        if self.reader is not None:
+            return self.reader.read(self.index, 1)[0]
+        return self.data[self.index]
+
+    def _get_plot_state(self):
+        return super(GraphPaneGUI, self)._get_plot_state() + (id(self.x_axis),)
+
+    def _collect_pane_calculations(self):
+        for index, calculation in list(self.pane_calculations.items()):
+            if abs(index - self.index) > self.prefetched_panes:
+                calculation.cancel()
+                del self.pane_calculations[index]
+            elif calculation.done():
+                del self.pane_calculations[index]
+                if calculation.exception() is None:
+                    self.pane_cache.put(index, calculation.result())
+
+    def _prefetch_panes(self):
+        # The background thread reads the panes straight from the data (and not through the streaming reader which is
+        # only used by the GUI thread)
+        for index in range(self.index - self.prefetched_panes, self.index + self.prefetched_panes + 1):
+            if 0 <= index <= self.max_index and index not in self.pane_cache.outputs and \
+                    index not in self.pane_calculations:
+                self.pane_calculations[index] = _get_pane_transform_executor().submit(_transform_pane, self.data,
+                                                                                       self.transform, index)
+
+    def _get_transformed_pane(self):
+        if self.transform is None:
+            return self._read_data()
+
+        pane_cache_state = (id(self.data), id(self.transform))
+        if pane_cache_state != self.pane_cache_state:
+            for calculation in self.pane_calculations.values():
+                calculation.cancel()
+            self.pane_calculations = {}
+            self.pane_cache.clear()
+            self.pane_cache_state = pane_cache_state
+
+        self._collect_pane_calculations()
+
+        is_cached, y = self.pane_cache.get(self.index)
+        if not is_cached:
+            calculation = self.pane_calculations.pop(self.index, None)
+            if calculation is not None and not calculation.cancel():
+                y = calculation.result()
+            else:
+                y = self.transform(self._read_data())
+            self.pane_cache.put(self.index, y)
+
+        self._prefetch_panes()
+
+        return y
+
     def _update_plot(self):
         if len(np.shape(self.data)) == 2:
-            y = self.data[self.index, :]
-            if self.transform is not None:
-                y = self.transform(y)
+            y = self._get_transformed_pane()
             if self.fillLevel is None:
                 self.plot_data_item.setData(self.x_axis, y, stepMode=self.stepmode, brush=self.brush)
             else:
@@ -209,10 +322,7 @@ class GraphPaneGUI(AbstractSequencerGUI):
             connect[np.arange(self.data.shape[2] - 1, self.data.shape[2] * self.data.shape[1], self.data.shape[2])] = 0
             self.plot_data_item.opts['connect'] = connect
 
-            y = self.data[self.index, :, :]
-
-            if self.transform is not None:
-                y = self.transform(y)
+            y = self._get_transformed_pane()
 
             y = y.flatten()
             self.plot_data_item.setData(self.x_axis, y, pen='k')
@@ -233,7 +343,7 @@ class GraphPaneGUI(AbstractSequencerGUI):
 
             self._update_text_and_slider()
 
-            self._update_plot()
+            self._update_plot_if_changed()
 
 
 class GraphRangeGUI(GraphPaneGUI):
@@ -242,8 +352,22 @@ class GraphRangeGUI(GraphPaneGUI):
 
         self.tracker_range_variable_name = None
         self.index_range = None
+        self.x_axis_multiplier = 1
         self.brush = (0, 0, 0, 255)
         self.range_is_being_edited = False
+        self.pyramid = None
+        self.geometry = None
+        self.geometry_key = None
+        self.streaming_axis = -1
+
+        # The number of bins the samples get decimated to follows the width of the plot
+        self.plot_widget.getViewBox().sigResized.connect(self.on_plot_resized)
+
+        # With a RingBufferSource as the data the window follows its head, redrawing at its own rate, and the latest
+        # samples get copied into live_buffer
+        self.live_buffer = None
+        self.live_timer = QtCore.QTimer()
+        self.live_timer.timeout.connect(self.on_timer_tick)
 
         self.edit_text_range = QtWidgets.QLineEdit()
         self.edit_text_range.returnPressed.connect(self.on_new_range)
@@ -252,6 +376,18 @@ class GraphRangeGUI(GraphPaneGUI):
         self.buttons_layout.addWidget(self.edit_text_range)
         self.buttons_layout.addSpacing(20)
 
+    def closeEvent(self, event):
+        self.live_timer.stop()
+        super(GraphRangeGUI, self).closeEvent(event)
+
+    def _is_live(self):
+        return isinstance(self.data, streaming.RingBufferSource)
+
+    def on_slider_change(self):
+        # A live window's position follows the head of its source and not the tracker variable
+        if not self._is_live():
+            super(GraphRangeGUI, self).on_slider_change()
+
     def on_button_forwards(self):
         index = self.repl_globals[self.tracker_variable_name]
         if index < self.max_index:
@@ -277,6 +413,9 @@ class GraphRangeGUI(GraphPaneGUI):
     def on_range_edited(self):
         self.range_is_being_edited = True
 
+    def watched_variable_names(self):
+        return super(GraphRangeGUI, self).watched_variable_names() + [self.tracker_range_variable_name]
+
     def _update_index(self):
         try:
             self.index = self.repl_globals[self.tracker_variable_name]
@@ -290,24 +429,55 @@ class GraphRangeGUI(GraphPaneGUI):
             print('Variable {} to use as index not defined in the REPL'.format(self.tracker_range_variable_name))
             self.close()
 
+        if self._is_live():
+            # The position of the first of the latest index_range samples. It is not written back to the tracker
+            # variable since that would have every other window watching it redraw at the live rate
+            self.index = max(0, self.data.head - self.index_range)
+
     def _setup_maximum_index_value(self):
         self.max_index = np.shape(self.data)[-1] - 1 - self.index_range
         self.slider_position.setMaximum(self.max_index)
 
-    def _setup_x_axis(self):
-        if len(self.data.shape) == 1:
-            self.x_axis = np.arange(self.index_range)
-        if len(self.data.shape) == 2:
-            self.x_axis = np.tile(np.arange(self.index_range), self.data.shape[0])
-
+    def _update_x_axis_multiplier(self):
         if self.plotted_x_variable_name is not None:
             try:
-                x_axis_multiplier = np.array(self.repl_globals[self.plotted_x_variable_name])
+                self.x_axis_multiplier = float(np.array(self.repl_globals[self.plotted_x_variable_name]))
             except KeyError:
                 print('X axis multiplier variable {} is not defined in the REPL'.format(
                     self.plotted_x_variable_name))
                 self.close()
-            self.x_axis = self.x_axis.astype(np.float) * x_axis_multiplier
+
+    def _get_number_of_bins(self):
+        # With more samples than about 2 per horizontal pixel only the min and max of each pixel column get plotted
+        number_of_bins = max(1, self.plot_widget.width())
+        if self.index_range <= 2 * number_of_bins:
+            return None
+        return number_of_bins
+
+    def _get_plot_state(self):
+        # While fewer than index_range samples have been pushed to a live source the index stays at 0 so its head is
+        # needed to see that there is something new to show
+        head = self.data.head if self._is_live() else None
+        return super(GraphRangeGUI, self)._get_plot_state() + (self.index_range, self.geometry_key, head)
+
+    def on_plot_resized(self):
+        scheduler.mark_dirty(self)
+
+    def _get_geometry_key(self):
+        return np.shape(self.data), self.index_range, self.x_axis_multiplier, self.plot_widget.width(), \
+            self._get_number_of_bins()
+
+    def _setup_x_axis(self):
+        number_of_bins = self._get_number_of_bins()
+        if number_of_bins is None:
+            x_axis = np.arange(self.index_range, dtype=float)
+        else:
+            x_axis = np.repeat(decimation.bin_starts(0, self.index_range, number_of_bins), 2).astype(float)
+
+        number_of_channels = 1 if len(np.shape(self.data)) == 1 else np.shape(self.data)[0]
+        self.geometry = plot_geometry.LineGeometry(x_axis * self.x_axis_multiplier, number_of_channels)
+        self.geometry_key = self._get_geometry_key()
+        self.x_axis = self.geometry.x
 
     def _update_text_and_slider(self):
         if self.text_is_being_edited is False:
@@ -317,62 +487,113 @@ class GraphRangeGUI(GraphPaneGUI):
         if self.range_is_being_edited is False:
             self.edit_text_range.setText(str(self.index_range))
 
-    def _update_plot(self):
+    def _get_decimated_data(self, number_of_bins):
+        # Without a transform the mins and maxs come from the pyramid which costs the same whatever the range is.
+        # A pyramid needs a pass over all the data so it is not used when streaming from a memmap
+        if self.transform is None and self.reader is None and not self._is_live():
+            if self.pyramid is None or self.pyramid.data is not self.data:
+                self.pyramid = decimation.MinMaxPyramid(self.data)
+            decimated = self.pyramid.query(self.index, self.index + self.index_range, number_of_bins)
+            if decimated is not None:
+                return decimated[1]
+
+        y = self._read_data()
+        if self.transform is not None:
+            y = self.transform(y)
+
+        return decimation.minmax_decimate(y, number_of_bins)[1]
+
+    def _read_data(self):
+        if self._is_live():
+            y, _ = self.data.latest(self.index_range, self.live_buffer)
+            self.live_buffer = y.base if y.base is not None else y
+            return y
+        if self.reader is not None:
+            return self.reader.read(self.index, self.index_range)
         if len(np.shape(self.data)) == 1:
-            y = self.data[self.index:(self.index + self.index_range)]
-
-            if self.transform is not None:
-                y = self.transform(y)
-
-            self.plot_data_item.setData(self.x_axis, y, pen='k')
-
-        elif len(np.shape(self.data)) == 2:
-            # The connect argument allows a single line to be broken up (see pg.ArrayToQPath) so that the
-            # 1D array data[index, :, :].flatten() shows up as multiple independent lines
-            connect = np.ones(len(self.x_axis))
-
-            y = self.data[:, self.index:(self.index + self.index_range)]
+            return self.data[self.index:(self.index + self.index_range)]
+        return self.data[:, self.index:(self.index + self.index_range)]
 
+    def _update_plot(self):
+        if self._is_live() and self.data.head == 0:
+            # Nothing has been pushed yet
+            self.plot_data_item.clear()
+            return
+
+        number_of_bins = self._get_number_of_bins()
+        if number_of_bins is None:
+            y = self._read_data()
             if self.transform is not None:
                 y = self.transform(y)
+        else:
+            y = self._get_decimated_data(number_of_bins)
 
-            y = y.flatten()
-            connect[np.arange(self.index_range - 1, y.size, self.index_range)] = 0
-            self.plot_data_item.opts['connect'] = connect
+        geometry = self.geometry
+        if not geometry.fits(y):
+            # A transform that changes the number of samples (or a range running past the end of the data)
+            geometry = plot_geometry.LineGeometry(np.arange(np.shape(y)[-1]) * self.x_axis_multiplier,
+                                                  self.geometry.y_buffer.shape[0])
 
-            self.plot_data_item.setData(self.x_axis, y, pen='k')
+        self.plot_data_item.opts['connect'] = geometry.connect
+        self.plot_data_item.setData(geometry.x, geometry.fill(y), pen='k')
 
     def on_timer_tick(self):
         if self.repl_globals is not None:
 
             if self.data is None:
                 self._load_data()
+                if self._is_live():
+                    self.live_timer.start(LIVE_UPDATE_TIME_MILLIS)
 
             self._update_index()
 
-            self._setup_maximum_index_value()
+            self._update_x_axis_multiplier()
 
-            self._setup_x_axis()
+            # The x axis, connect and y buffers and the maximum index only change with the data shape, the range,
+            # the x axis multiplier or the number of pixels
+            if self._get_geometry_key() != self.geometry_key:
+                self._setup_maximum_index_value()
+                self._setup_x_axis()
 
             self._update_text_and_slider()
 
-            self._update_plot()
+            self._update_plot_if_changed()
 
 
 class ImagesGUI(AbstractSequencerGUI):
+    # Emitted (from the frame reader's thread) once the true frame count of a video is known
+    index_built = QtCore.pyqtSignal()
+
     def __init__(self):
         super(ImagesGUI, self).__init__()
 
-        self.capture = None
+        self.frame_reader = None
         self.base_image_name = None
+        self.superimposed_image_name = None
+        self.superimposed_image = None
+        self.overlays_key = None
+        self.compositor = compositing.OverlayCompositor()
         self.index = None
         self.is_movie_playing = False
 
+        self.movie_timer = QtCore.QTimer()
+        self.movie_timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.movie_timer.timeout.connect(self.on_timer_tick)
+        self.index_built.connect(self._on_index_built)
+
+        # Frames per second to play arrays at (videos play at their own) and how much faster than that to play
+        self.fps = playback.DEFAULT_FPS
+        self.playback_clock = playback.PlaybackClock()
+        self.last_report_time = 0
+
         self.image_levels = None
         self.lut = None
 
         self.flip = None
 
+        self.frame_cache = frame_cache.FrameCache()
+        self.frame_cache_state = None
+
         self.image_widget = RawImageWidget.RawImageWidget()
 
         self.image_widget.scaled = True
@@ -391,9 +612,21 @@ class ImagesGUI(AbstractSequencerGUI):
         self.play_buttons_layout.addWidget(self.button_play_movie)
         self.play_buttons_layout.addWidget(self.button_stop_movie)
 
+        self.label_playback = QtWidgets.QLabel()
+        self.play_buttons_layout.addWidget(self.label_playback)
+
         self.layout_window.insertWidget(0, self.image_widget)
         self.layout_window.insertLayout(-1, self.play_buttons_layout)
 
+    def closeEvent(self, event):
+        self.movie_timer.stop()
+        if self.frame_reader is not None:
+            self.frame_reader.close()
+        super(ImagesGUI, self).closeEvent(event)
+
+    def watched_variable_names(self):
+        return [self.tracker_variable_name, self.base_image_name, self.superimposed_image_name]
+
     def _load_data(self):
         try:
             self.base_image = self.repl_globals[self.base_image_name]
@@ -403,61 +636,105 @@ class ImagesGUI(AbstractSequencerGUI):
 
         if self.base_image.__class__ is str:
             try:
-                import cv2
-                self.capture = cv2.VideoCapture(self.base_image)
+                import frame_reader
+                self.frame_reader = frame_reader.VideoFrameReader(self.base_image,
+                                                                  on_index_built=self.index_built.emit)
             except ModuleNotFoundError:
                 print('You need to have Open CV 3 installed to pass a video file to the video sequencer')
                 self.close()
         else:
             self.data = self.repl_globals[self.base_image_name]
 
+    def _load_overlays(self):
+        # The overlays get prepared again only when the superimposed variable is reassigned, changes (as far as its
+        # fingerprint can tell) or gets touched (see scheduler.touch)
         if self.superimposed_image_name is not None:
             try:
-                self.superimposed_image = self.repl_globals[self.superimposed_image_name]
+                superimposed_image = self.repl_globals[self.superimposed_image_name]
             except KeyError:
                 print('Variable {} to superimpose to plot not defined in the REPL'.format(self.superimposed_image_name))
                 self.close()
-            if self.superimposed_image.shape[2] != 4:
+                return
+            overlays_key = (scheduler.get_version(self.repl_globals, self.superimposed_image_name),
+                            fp.fingerprint(superimposed_image))
+            if overlays_key == self.overlays_key:
+                return
+            self.overlays_key = overlays_key
+            self.superimposed_image = superimposed_image
+
+            # One RGBA image or a list of them (blended in order)
+            superimposed_images = self.superimposed_image
+            if isinstance(superimposed_images, np.ndarray) and superimposed_images.ndim == 3:
+                superimposed_images = [superimposed_images]
+            if any(np.shape(image)[2:] != (4,) for image in superimposed_images):
                 print('Superimposed image needs transparency so it needs to be an RGBA (4 values in its 3rd dimension) matrix')
                 self.close()
+                return
+            self.compositor.set_overlays(superimposed_images, transpose=True)
 
     def _setup_maximum_index_value(self):
-        if self.capture is not None:
-            frames = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        if self.frame_reader is not None:
+            frames = self.frame_reader.frame_count
         elif self.data is not None:
             frames = self.data.shape[0]
         self.max_index = frames - 1
         self.slider_position.setMaximum(self.max_index)
 
-    def _update_plot(self):
-        if self.capture is not None:
-            self.capture.set(cv2.CAP_PROP_POS_FRAMES, self.index)
-            ok, self.data = self.capture.read()
-            if ok:
-                data = np.transpose(self.data, [1, 0, 2])
-            else:
+    def _on_index_built(self):
+        if self.frame_reader is not None:
+            self.max_index = None
+            scheduler.mark_dirty(self)
+
+    def _prepare_frame(self):
+        if self.frame_reader is not None:
+            frame = self.frame_reader.get_frame(self.index)
+            if frame is None:
                 print('Could not retrieve frame {} from movie'.format(self.index))
+                # So that the frame gets asked for again. Event driven windows (see scheduler) get no next tick unless
+                # they ask for one
+                self.plot_state = None
+                QtCore.QTimer.singleShot(FRAME_RETRY_TIME_MILLIS, lambda: scheduler.mark_dirty(self))
+                return None
+            data = np.transpose(frame, [1, 0, 2])
         else:
             data = self.data[self.index, :, :].transpose()
 
-        if self.superimposed_image_name is not None:
-            superimposed_image = np.transpose(self.superimposed_image, [1, 0, 2])
-            #superimposed_image = self.superimposed_image
-            if superimposed_image.shape[:2] != data.shape[:2]:
-                print('Superimposed image should have the same x, y dimensions as base image')
-                self.close()
-            visible_pixels_mask = superimposed_image[:, :, 3] > 0
-            if len(data.shape) == 3:
-                data[visible_pixels_mask] = superimposed_image[visible_pixels_mask, :-1]
-            elif len(data.shape) == 2:
-                data[visible_pixels_mask] = superimposed_image[visible_pixels_mask, :-2]
+        if not self.compositor.fits(data):
+            print('Superimposed image should have the same x, y dimensions as base image')
+            self.close()
+            return None
+        data = self.compositor.compose(data)
 
         if self.flip == 'ud' or self.flip == 'udlr':
             data = np.fliplr(data)
         if self.flip == 'lr' or self.flip == 'udlr':
             data = np.flipud(data)
 
-        if self.capture is None:
+        # A copy so that the cached frame does not change with (or keep alive) the source it was made from
+        return np.array(data, order='C')
+
+    def _get_plot_state(self):
+        # The version (see scheduler.touch) is what shows in place changes of the frames
+        return self.index, id(self.data), id(self.frame_reader), self.overlays_key, self.flip, \
+            scheduler.get_version(self.repl_globals, self.base_image_name)
+
+    def _update_plot(self):
+        # The cached frames are only valid for the source (and its version, see scheduler.touch), superimposed image and
+        # flip they were prepared with
+        frame_cache_state = (id(self.data), scheduler.get_version(self.repl_globals, self.base_image_name),
+                             id(self.frame_reader), self.overlays_key, self.flip)
+        if frame_cache_state != self.frame_cache_state:
+            self.frame_cache.clear()
+            self.frame_cache_state = frame_cache_state
+
+        data = self.frame_cache.get(self.index)
+        if data is None:
+            data = self._prepare_frame()
+            if data is None:
+                return
+            self.frame_cache.put(self.index, data)
+
+        if self.frame_reader is None:
             self.image_widget.setImage(data, levels=self.image_levels, lut=self.lut)
         else:
             self.image_widget.setImage(data)
@@ -466,27 +743,59 @@ class ImagesGUI(AbstractSequencerGUI):
     def on_timer_tick(self):
         if self.repl_globals is not None:
 
-            if self.data is None:
+            if self.data is None and self.frame_reader is None:
                 self._load_data()
 
+            self._load_overlays()
+
             if self.max_index is None:
                 self._setup_maximum_index_value()
 
+            if self.is_movie_playing:
+                self._advance_movie()
+
             self._update_index()
 
             self._update_text_and_slider()
 
-            self._update_plot()
+            self._update_plot_if_changed()
 
-            if self.is_movie_playing:
-                self.repl_globals[self.tracker_variable_name] += 1
+            if self.is_movie_playing and self.plot_state is not None and \
+                    self.index != self.playback_clock.last_index:
+                self.playback_clock.frame_shown(self.index)
+                self._report_playback()
+
+    def _advance_movie(self):
+        # Go to the frame the playback clock says should be showing now, skipping any there was no time to show
+        index = self.playback_clock.target_index()
+        if index > self.max_index:
+            index = self.max_index
+            self.on_stop_movie()
+        if index != self.repl_globals[self.tracker_variable_name]:
+            self.repl_globals[self.tracker_variable_name] = index
+
+    def _report_playback(self, force=False):
+        now = time.monotonic()
+        if force or now - self.last_report_time > 0.5:
+            self.label_playback.setText(self.playback_clock.report())
+            self.last_report_time = now
 
     def on_play_movie(self):
-        self.timer.setInterval(1)
+        if self.frame_reader is not None and self.frame_reader.fps > 0:
+            self.playback_clock.fps = self.frame_reader.fps
+        else:
+            self.playback_clock.fps = self.fps
+        self.playback_clock.start(self.repl_globals[self.tracker_variable_name])
+
+        # While playing the window needs a tick for every frame, not only when the REPL variables change. Ticking
+        # at twice the frame rate keeps every frame within half a frame of when it is due
+        self.movie_timer.start(max(1, int(500 / self.playback_clock.frame_rate())))
         self.is_movie_playing = True
 
     def on_stop_movie(self):
-        self.timer.setInterval(ct.TIMER_UPDATE_TIME_MILLIS)
+        self.movie_timer.stop()
+        if self.is_movie_playing:
+            self._report_playback(force=True)
         self.is_movie_playing = False
 
 
@@ -495,19 +804,26 @@ if QtWidgets.QApplication.instance() is None:
 
 
 def graph_pane(repl_globals, tracker_variable_name, plotted_y_variable_name,
-               plotted_x_variable_name=None, transform_name=None):
+               plotted_x_variable_name=None, transform_name=None, streaming=False, read_ahead=0,
+               prefetched_panes=PREFETCHED_PANES):
     win = GraphPaneGUI()
+    win.prefetched_panes = prefetched_panes
+    win.pane_cache.max_size = max(PANE_CACHE_SIZE, 2 * prefetched_panes + 1)
     open_windows[win.uuid] = win
     win.repl_globals = repl_globals
     win.plotted_y_variable_name = plotted_y_variable_name
     win.plotted_x_variable_name = plotted_x_variable_name
     win.tracker_variable_name = tracker_variable_name
     win.transform_name = transform_name
+    win.streaming = streaming
+    win.read_ahead = read_ahead
     win.show()
+    return win
 
 
 def graph_range(repl_globals, tracker_variable_name, tracker_range_variable_name,
-                plotted_y_variable_name, plotted_x_variable_name=None, transform_name=None):
+                plotted_y_variable_name, plotted_x_variable_name=None, transform_name=None, streaming=False,
+                read_ahead=0):
     win = GraphRangeGUI()
     open_windows[win.uuid] = win
     win.repl_globals = repl_globals
@@ -516,12 +832,22 @@ def graph_range(repl_globals, tracker_variable_name, tracker_range_variable_name
     win.tracker_variable_name = tracker_variable_name
     win.tracker_range_variable_name = tracker_range_variable_name
     win.transform_name = transform_name
+    win.streaming = streaming
+    win.read_ahead = read_ahead
     win.show()
+    return win
 
 
 def image_sequence(repl_globals, tracker_variable_name, base_image_name, superimposed_image_name=None,
-                   image_levels=None, colormap=None, opacity=None, flip=None):
+                   image_levels=None, colormap=None, opacity=None, flip=None,
+                   frame_cache_bytes=frame_cache.DEFAULT_FRAME_CACHE_BYTES, fps=playback.DEFAULT_FPS,
+                   playback_speed=1.):
+    # Movies play at the fps of the video (or at fps for arrays) times the playback_speed, dropping frames if they
+    # cannot be shown fast enough
     win = ImagesGUI()
+    win.frame_cache.max_bytes = frame_cache_bytes
+    win.fps = fps
+    win.playback_clock.speed = playback_speed
     open_windows[win.uuid] = win
     win.repl_globals = repl_globals
     win.base_image_name = base_image_name
@@ -529,25 +855,12 @@ def image_sequence(repl_globals, tracker_variable_name, base_image_name, superim
     win.tracker_variable_name = tracker_variable_name
     win.image_levels = image_levels
 
-    max = 255
-    if image_levels is not None:
-        max = image_levels[1]
-
-    if colormap is not None:
-        if repl_globals[base_image_name].__class__ is str:
-            print('Colormap info will not be used on video frames')
-        else:
-            colormap = plt.get_cmap(colormap)
-            colormap._init()
-            win.lut = (colormap._lut * max).view(np.ndarray)
-    else:
-        win.lut = max * np.ones((259, 4))
-
-    if opacity is not None:
-        win.lut[:, 3] = opacity
-    else:
-        win.lut[:, 3] = 255
+    if colormap is not None and repl_globals[base_image_name].__class__ is str:
+        print('Colormap info will not be used on video frames')
+        colormap = None
+    win.lut = colormaps.get_lut(colormap, colormaps.freeze(image_levels), opacity)
 
     win.flip = flip
 
     win.show()
+    return win
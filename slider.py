@@ -1,18 +1,84 @@
 
+import itertools
+import pickle
+import traceback
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
 from PyQt5 import QtWidgets, QtCore
 
 import basic_transform as bt
+import fingerprint as fp
+import output_cache as oc
+import scheduler
+
+
+def _evaluate_vectorized(function, values, function_args_value):
+    # Returns None if the function does not take the whole array of values and give back one result per value (the
+    # same ones it gives for single values)
+    try:
+        outputs = function(values, *function_args_value)
+    except Exception:
+        return None
+    if np.ndim(outputs) == 0 or len(outputs) != len(values):
+        return None
+    for i in [0, len(values) - 1]:
+        if not np.array_equal(outputs[i], function(values[i].item(), *function_args_value)):
+            return None
+    return outputs
+
+
+def _evaluate_in_process_pool(function, values, function_args_value):
+    # The function needs to be picklable (e.g. not a lambda) for this to work. The pool is its own (and not the one
+    # the transforms share) so that one that breaks (e.g. on a function defined in the REPL after a shared pool forked)
+    # is simply shut down
+    repeated_args = [itertools.repeat(arg, len(values)) for arg in function_args_value]
+    chunksize = max(1, len(values) // 64)
+    try:
+        with futures.ProcessPoolExecutor() as pool:
+            return list(pool.map(function, values.tolist(), *repeated_args, chunksize=chunksize))
+    except (pickle.PicklingError, AttributeError, TypeError, BrokenProcessPool):
+        return None
+
+
+def evaluate_over_range(function, minimum, maximum, function_args_value):
+    values = np.arange(minimum, maximum + 1)
+
+    outputs = _evaluate_vectorized(function, values, function_args_value)
+    if outputs is None:
+        outputs = _evaluate_in_process_pool(function, values, function_args_value)
+    if outputs is None:
+        outputs = [function(value, *function_args_value) for value in values.tolist()]
+
+    if isinstance(outputs, np.ndarray) and outputs.ndim == 1:
+        # So that the outputs are python ints, floats and bools like the ones the function gives for single values
+        return outputs.tolist()
+    return list(outputs)
 
 
 class MainWindow(bt.BasicTransform):
+    # Emitted (from a pool thread) when the evaluation of the function over all the slider positions finishes
+    lookup_table_calculated = QtCore.pyqtSignal(object)
+
     def __init__(self, repl_globals, input_var_name, function_name, output_var_name, function_args_name=None,
-                 slider_limits=None):
+                 slider_limits=None, executor=None, output_cache_size=oc.DEFAULT_OUTPUT_CACHE_SIZE, batch=False,
+                 lookup_table_name=None):
         # call super class constructor
         super(MainWindow, self).__init__(repl_globals, input_var_name, function_name, output_var_name,
-                                         function_args_name)
+                                         function_args_name, executor, output_cache_size)
 
         self.update_input_from_repl = True
 
+        # In batch mode the function gets evaluated once for every position of the slider and moving the slider
+        # just looks its output up
+        self.batch = batch
+        self.lookup_table_name = lookup_table_name
+        self.lookup_table = None
+        self.lookup_table_key = None
+        self.lookup_table_calculation_key = None
+        self.lookup_table_calculated.connect(self._on_lookup_table_calculated)
+
         self.input_widget = QtWidgets.QSlider(QtCore.Qt.Horizontal)
         if slider_limits is not None:
             self.input_widget.setRange(slider_limits[0], slider_limits[1])
@@ -74,6 +140,57 @@ class MainWindow(bt.BasicTransform):
                 print('Variable {} not defined in the REPL'.format(self.input_var_name))
                 self.close()
 
+    def _update_lookup_table(self):
+        function = self._get_currently_used_function()
+        function_args_value = self._get_function_args_value()
+        minimum = self.input_widget.minimum()
+        maximum = self.input_widget.maximum()
+
+        key = (function, tuple(function_args_value), minimum, maximum)
+        key = fp.content_key(key) or fp.fingerprint(key)
+        if key == self.lookup_table_key or key == self.lookup_table_calculation_key:
+            return
+
+        # The evaluation runs in the background and until it is done the outputs get calculated one at a time
+        self.lookup_table = None
+        self.lookup_table_key = None
+        self.lookup_table_calculation_key = key
+        calculation = bt.get_executor('thread').submit(evaluate_over_range, function, minimum, maximum,
+                                                       function_args_value)
+        calculation.add_done_callback(lambda calculation: self.lookup_table_calculated.emit((key, calculation)))
+
+    def _on_lookup_table_calculated(self, key_and_calculation):
+        key, calculation = key_and_calculation
+        if key != self.lookup_table_calculation_key:
+            return
+        self.lookup_table_calculation_key = None
+
+        # A failed evaluation is not tried again until the function, its arguments or the slider limits change
+        self.lookup_table_key = key
+        try:
+            self.lookup_table = calculation.result()
+        except Exception:
+            traceback.print_exc()
+            self.label_transfrom_func_name.setStyleSheet("color: red")
+            return
+
+        if self.lookup_table_name is not None:
+            try:
+                self.repl_globals[self.lookup_table_name] = np.array(self.lookup_table)
+            except ValueError:
+                self.repl_globals[self.lookup_table_name] = self.lookup_table
+        scheduler.mark_dirty(self)
+
+    def _set_output_variable(self):
+        if self.batch and self.is_connection_on:
+            self._update_lookup_table()
+            position = self.input_var_value - self.input_widget.minimum()
+            if self.lookup_table is not None and 0 <= position < len(self.lookup_table):
+                self._show_output_variable(self.lookup_table[position])
+                return
+
+        super(MainWindow, self)._set_output_variable()
+
     def _on_button_forwards(self):
         self.input_widget.setValue(self.input_widget.value() + self.input_widget.singleStep())
 
@@ -90,8 +207,14 @@ class MainWindow(bt.BasicTransform):
         pass
 
 def connect_repl_var(repl_globals, input_var_name, function_name, output_var_name, function_args_name=None,
-                     slider_limits=None):
+                     slider_limits=None, executor=None, output_cache_size=oc.DEFAULT_OUTPUT_CACHE_SIZE, batch=False,
+                     lookup_table_name=None):
+    # With an output_cache_size larger than 1 going back to slider positions that were already visited does not
+    # call the function again.
+    # With batch=True the function is evaluated for all the slider positions at once, in the background (vectorized if
+    # the function takes arrays, in a process pool if not) and once that is done the slider just looks the outputs up.
+    # If lookup_table_name is given the outputs for all positions also go into that REPL variable.
     win = MainWindow(repl_globals, input_var_name, function_name, output_var_name, function_args_name,
-                     slider_limits)
+                     slider_limits, executor, output_cache_size, batch, lookup_table_name)
     bt.open_windows[win.uuid] = win
     win.show()
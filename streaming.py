@@ -0,0 +1,191 @@
+import numpy as np
+
+
+class MemmapWindowReader:
+    # Reads only the part of a (memmapped) array that is needed along one axis, plus read_ahead times that length in
+    # the direction the index last moved, so that scrolling through a file bigger than the RAM does not touch the disk
+    # on every step. Only the last read window is kept in memory.
+    def __init__(self, data, axis=-1, read_ahead=0):
+        self.data = data
+        self.axis = axis % len(data.shape)
+        self.read_ahead = read_ahead
+
+        self.buffer = None
+        self.buffer_start = 0
+        self.buffer_stop = 0
+        self.last_start = None
+
+    def _slice(self, start, stop):
+        index = [slice(None)] * len(self.data.shape)
+        index[self.axis] = slice(start, stop)
+        return tuple(index)
+
+    def read(self, start, length):
+        stop = min(start + length, self.data.shape[self.axis])
+
+        if self.buffer is None or start < self.buffer_start or stop > self.buffer_stop:
+            extra = int(self.read_ahead * length)
+            buffer_start, buffer_stop = start, stop
+            if self.last_start is not None and start < self.last_start:
+                buffer_start = max(0, start - extra)
+            else:
+                buffer_stop = min(stop + extra, self.data.shape[self.axis])
+
+            self.buffer = np.array(self.data[self._slice(buffer_start, buffer_stop)])
+            self.buffer_start = buffer_start
+            self.buffer_stop = buffer_stop
+
+        self.last_start = start
+
+        return self.buffer[self._slice(start - self.buffer_start, stop - self.buffer_start)]
+
+
+class AppendBuffer:
+    # A copy of an array that keeps growing along its last axis (e.g. with np.append in an acquisition loop). If a new
+    # version of the array starts with what was seen before (checked on a few samples only) just its new tail gets
+    # copied, into a preallocated buffer that grows geometrically. With a rolling_window only its last rolling_window
+    # samples are kept.
+    NUMBER_OF_PREFIX_SAMPLES = 16
+    MINIMUM_CAPACITY = 1024
+
+    def __init__(self, rolling_window=None, growth_factor=2):
+        self.rolling_window = rolling_window
+        self.growth_factor = growth_factor
+
+        self.buffer = None
+        self.indices_buffer = None
+        # Positions along the last axis of the source array of buffer[..., 0] and of the end of what was copied
+        self.offset = 0
+        self.stop = 0
+
+    @property
+    def start(self):
+        if self.rolling_window is None:
+            return self.offset
+        return max(self.offset, self.stop - self.rolling_window)
+
+    @property
+    def data(self):
+        return self.buffer[..., self.start - self.offset:self.stop - self.offset]
+
+    def indices(self):
+        # The positions in the source array of the samples in data
+        return self.indices_buffer[self.start - self.offset:self.stop - self.offset]
+
+    def _is_extension(self, array):
+        if self.buffer is None or array.dtype != self.buffer.dtype or array.shape[:-1] != self.buffer.shape[:-1] or \
+                not self.stop <= array.shape[-1]:
+            return False
+        if self.rolling_window is not None and array.shape[-1] - self.stop > self.rolling_window:
+            return False
+        if self.stop == self.offset:
+            return True
+
+        positions = np.unique(np.linspace(self.offset, self.stop - 1, self.NUMBER_OF_PREFIX_SAMPLES).astype(np.intp))
+        return np.array_equal(array[..., positions], self.buffer[..., positions - self.offset],
+                              equal_nan=array.dtype.kind in 'fc')
+
+    def _reserve(self, length):
+        capacity = 0 if self.buffer is None else self.buffer.shape[-1]
+        if self.stop - self.offset + length <= capacity:
+            return
+
+        # Whatever has scrolled out of the rolling window gets dropped instead of growing the buffer
+        kept_start = self.start
+        kept = self.buffer[..., kept_start - self.offset:self.stop - self.offset]
+        needed = kept.shape[-1] + length
+        if self.rolling_window is None:
+            capacity = max(needed, int(capacity * self.growth_factor), self.MINIMUM_CAPACITY)
+        else:
+            capacity = max(needed, 2 * self.rolling_window)
+
+        buffer = np.empty(self.buffer.shape[:-1] + (capacity,), dtype=self.buffer.dtype)
+        buffer[..., :kept.shape[-1]] = kept
+        self.buffer = buffer
+        self.offset = kept_start
+        self.indices_buffer = np.arange(self.offset, self.offset + capacity)
+
+    def update(self, array):
+        # Returns the number of samples that got copied
+        if self._is_extension(array):
+            new = array[..., self.stop:]
+        else:
+            new = array
+            if self.rolling_window is not None:
+                new = array[..., max(0, array.shape[-1] - self.rolling_window):]
+            self.offset = self.stop = array.shape[-1] - new.shape[-1]
+            self.buffer = np.empty(array.shape[:-1] + (0,), dtype=array.dtype)
+            self.indices_buffer = np.arange(self.offset, self.offset)
+
+        length = new.shape[-1]
+        self._reserve(length)
+        position = self.stop - self.offset
+        self.buffer[..., position:position + length] = new
+        self.stop += length
+        return length
+
+
+class RingBufferSource:
+    # A live source of samples for sequence_viewer.graph_range. One producer thread pushes blocks of samples and the
+    # GUI reads the latest ones. There are no locks: the producer moves write_head on to where a block will end, writes
+    # it and only then moves the head on, and a reader checks after copying that write_head did not lap (get to
+    # overwrite) what it copied, in which case it copies again. capacity needs to hold at least a few GUI ticks' worth
+    # of samples.
+    # shape is the shape of the ring (channels, capacity) and head the number of samples ever pushed.
+    MAX_READ_ATTEMPTS = 4
+
+    def __init__(self, capacity, number_of_channels=1, dtype=np.float32):
+        self.buffer = np.zeros((number_of_channels, capacity), dtype=dtype)
+        self.capacity = capacity
+        self.head = 0
+        self.write_head = 0
+
+    @property
+    def shape(self):
+        return self.buffer.shape
+
+    @property
+    def dtype(self):
+        return self.buffer.dtype
+
+    def push(self, block):
+        # block is (channels, samples), or (samples,) for a single channel
+        block = np.asarray(block).reshape(self.buffer.shape[0], -1)
+        length = block.shape[-1]
+        skipped = max(0, length - self.capacity)
+        block = block[:, skipped:]
+        length -= skipped
+
+        self.write_head = self.head + skipped + length
+        start = (self.head + skipped) % self.capacity
+        first_part = min(length, self.capacity - start)
+        self.buffer[:, start:start + first_part] = block[:, :first_part]
+        self.buffer[:, :length - first_part] = block[:, first_part:]
+
+        self.head += skipped + length
+
+    def _copy(self, start, length, out):
+        ring_start = start % self.capacity
+        first_part = min(length, self.capacity - ring_start)
+        out[:, :first_part] = self.buffer[:, ring_start:ring_start + first_part]
+        out[:, first_part:length] = self.buffer[:, :length - first_part]
+
+    def latest(self, length, out=None):
+        # Copies the latest length samples (fewer if not that many have been pushed yet) into out and returns the
+        # copied part of out and the position of its first sample
+        if out is None or out.shape[0] != self.buffer.shape[0] or out.shape[-1] < length:
+            out = np.empty((self.buffer.shape[0], length), dtype=self.buffer.dtype)
+
+        for _ in range(self.MAX_READ_ATTEMPTS):
+            head = self.head
+            length = min(length, head, self.capacity)
+            start = head - length
+            self._copy(start, length, out)
+            overwritten = self.write_head - self.capacity - start
+            if overwritten <= 0:
+                return out[:, :length], start
+
+        # Kept getting lapped (the producer pushes too much too often for a read this long) so only the part that
+        # was not overwritten while it got copied is returned
+        overwritten = min(overwritten, length)
+        return out[:, overwritten:length], start + overwritten
@@ -0,0 +1,153 @@
+import time
+
+from PyQt5 import QtCore
+
+import scheduler
+
+
+SYNC_UPDATE_TIME_MILLIS = 33
+VIDEO_TOLERANCE_MILLIS = 100
+
+
+class _Member:
+    # A REPL variable that is set to offset + time * rate (e.g. ms for a video, sample index for a graph_range,
+    # frame index for an image_sequence). If the window that shows it is given, the variable only gets set again once
+    # the window's last update would have had time to finish, so a slow window skips frames instead of holding the
+    # rest of the group back
+    def __init__(self, repl_globals, variable_name, rate, offset=0, window=None):
+        self.repl_globals = repl_globals
+        self.variable_name = variable_name
+        self.rate = rate
+        self.offset = offset
+        self.window = window
+        self.next_update_time = 0
+
+    def value_at(self, group_time):
+        value = self.offset + int(group_time * self.rate)
+        maximum = getattr(self.window, 'max_index', None)
+        if maximum is not None:
+            value = min(value, maximum)
+        return max(0, value)
+
+    def _last_update_duration(self):
+        if self.window is None:
+            return 0
+        registration = scheduler.get_scheduler().registrations.get(self.window.uuid)
+        if registration is None:
+            return 0
+        return registration.last_update_duration
+
+    def update(self, group_time, now, is_playing):
+        if is_playing and now < self.next_update_time:
+            return
+        value = self.value_at(group_time)
+        if self.repl_globals.get(self.variable_name) != value:
+            self.repl_globals[self.variable_name] = value
+        self.next_update_time = now + self._last_update_duration()
+
+
+class _VideoMember(_Member):
+    # A video_viewer plays by itself (seeking it on every tick would be far too slow) and only gets moved back to the
+    # group's time when it drifts from it by more than tolerance ms
+    def __init__(self, video_window, offset=0, tolerance=VIDEO_TOLERANCE_MILLIS):
+        super(_VideoMember, self).__init__(video_window.repl_globals, video_window.position_var_name, 1000, offset,
+                                           video_window)
+        self.tolerance = tolerance
+
+    def value_at(self, group_time):
+        return max(0, self.offset + int(group_time * self.rate))
+
+    def update(self, group_time, now, is_playing):
+        media_player = self.window.media_player
+        position = self.value_at(group_time)
+        if abs(media_player.position() - position) > self.tolerance or not is_playing:
+            media_player.setPosition(position)
+
+    def set_playing(self, is_playing, speed):
+        media_player = self.window.media_player
+        if is_playing:
+            media_player.setPlaybackRate(speed)
+            media_player.play()
+        else:
+            media_player.pause()
+
+
+class SyncGroup(QtCore.QObject):
+    # Plays a number of viewers together from one clock. Every tick the group's time (seconds, from a monotonic clock
+    # times the speed) gets turned into each member's index, all of them get set and the scheduler is flushed, so all
+    # the viewers get updated in the same tick.
+    # Example:
+    #   group = sync_group.SyncGroup()
+    #   group.add_video(video_viewer.video(globals(), 'position', 'file_name'))
+    #   group.add_graph(sequence_viewer.graph_range(globals(), 'sample', 'range', 'data'), sampling_rate=30000)
+    #   group.add_images(sequence_viewer.image_sequence(globals(), 'frame', 'frames'), fps=120)
+    #   group.play()
+    def __init__(self, speed=1.):
+        super(SyncGroup, self).__init__()
+
+        self.speed = speed
+        self.members = []
+        self.video_members = []
+
+        self.time = 0.
+        self.start_time = None
+        self.is_playing = False
+
+        self.timer = QtCore.QTimer()
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.timer.timeout.connect(self.on_tick)
+
+    def add(self, repl_globals, variable_name, rate, offset=0, window=None):
+        self.members.append(_Member(repl_globals, variable_name, rate, offset, window))
+
+    def add_video(self, video_window, offset=0, tolerance=VIDEO_TOLERANCE_MILLIS):
+        # offset in ms
+        member = _VideoMember(video_window, offset, tolerance)
+        self.members.append(member)
+        self.video_members.append(member)
+
+    def add_graph(self, graph_window, sampling_rate, offset=0):
+        # offset in samples
+        self.add(graph_window.repl_globals, graph_window.tracker_variable_name, sampling_rate, offset, graph_window)
+
+    def add_images(self, images_window, fps, offset=0):
+        # offset in frames
+        self.add(images_window.repl_globals, images_window.tracker_variable_name, fps, offset, images_window)
+
+    def current_time(self):
+        if not self.is_playing:
+            return self.time
+        return self.time + (time.monotonic() - self.start_time) * self.speed
+
+    def play(self):
+        if self.is_playing:
+            return
+        self.start_time = time.monotonic()
+        self.is_playing = True
+        for member in self.video_members:
+            member.set_playing(True, self.speed)
+        self.timer.start(SYNC_UPDATE_TIME_MILLIS)
+
+    def pause(self):
+        if not self.is_playing:
+            return
+        self.time = self.current_time()
+        self.is_playing = False
+        self.timer.stop()
+        for member in self.video_members:
+            member.set_playing(False, self.speed)
+        self.on_tick()
+
+    def seek(self, seconds):
+        self.time = seconds
+        self.start_time = time.monotonic()
+        for member in self.members:
+            member.next_update_time = 0
+        self.on_tick()
+
+    def on_tick(self):
+        group_time = self.current_time()
+        now = time.monotonic()
+        for member in self.members:
+            member.update(group_time, now, self.is_playing)
+        scheduler.get_scheduler().flush()
@@ -3,12 +3,15 @@
 from PyQt5 import QtWidgets
 
 import basic_transform as bt
+import output_cache as oc
 
 
 class MainWindow(bt.BasicTransform):
-    def __init__(self, repl_globals, input_var_name, function_name, output_var_name, function_args_name=None):
+    def __init__(self, repl_globals, input_var_name, function_name, output_var_name, function_args_name=None,
+                 executor=None, output_cache_size=oc.DEFAULT_OUTPUT_CACHE_SIZE):
         # call super class constructor
-        super(MainWindow, self).__init__(repl_globals, input_var_name, function_name, output_var_name, function_args_name)
+        super(MainWindow, self).__init__(repl_globals, input_var_name, function_name, output_var_name, function_args_name,
+                                         executor, output_cache_size)
 
         self.input_widget = QtWidgets.QLabel()
 
@@ -24,7 +27,9 @@ class MainWindow(bt.BasicTransform):
             self.close()
 
 
-def connect_repl_var(repl_globals, input_var_name, function_name, output_var_name, function_args_name=None):
-    win = MainWindow(repl_globals, input_var_name, function_name, output_var_name, function_args_name)
+def connect_repl_var(repl_globals, input_var_name, function_name, output_var_name, function_args_name=None,
+                     executor=None, output_cache_size=oc.DEFAULT_OUTPUT_CACHE_SIZE):
+    win = MainWindow(repl_globals, input_var_name, function_name, output_var_name, function_args_name, executor,
+                     output_cache_size)
     bt.open_windows[win.uuid] = win
     win.show()
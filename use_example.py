@@ -51,12 +51,17 @@ transform.connect_repl_var(globals(), 'position1', 'pos1_to_pos2', 'position2')
 # values in the repl.
 # Change the different values of the variables in the repl to see the guis update.
 
+# Instead of globals() you can give the guis an observable_namespace.ObservableNamespace and run the repl on it
+# (e.g. code.interact(local=ns) or IPython.embed(user_ns=ns)). The guis then update as soon as a variable they use is
+# assigned instead of checking the repl every 100 ms. After changing an array in place call ns.touch('variable_name').
+
 
 # The other guis available at the moment are
 # 1) One more types of sequence_viewer for images or frames of video (you can pass the name of a video in the
 # image_sequence function, or a 2d numpy array).
 # 2) The two types of one_shot_viewers (graph and image) where the shown data gets updated by the repl and not by the gui
-# 3) The video_viewer where a video can be played at real time (but only gives out frame keys and not individual frames)
+# 3) The video_viewer where a video can be played at real time (it gives out the position in ms and, if a
+# frame_var_name is passed to video, also the frame on the screen as an RGB array)
 # 4) The drop_down transform that is like the transform but has a drop down as input (connects to an itterable)
 
 # If in the graph function of the one_shot_viewer you pass x data that are one element longer than the y data then you
@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+
+import cv2
+
+
+INDEX_FILE_SUFFIX = '.frame_index.npz'
+
+
+class VideoIndex:
+    # The true number of frames of a video and the (presentation order) indices of its keyframes. Seeking to a
+    # keyframe and decoding forward is frame accurate, where seeking straight to any frame often is not. Without
+    # keyframes (they could not be found) seeks go straight to the frame.
+    def __init__(self, frame_count, keyframes=None):
+        self.frame_count = int(frame_count)
+        self.keyframes = None if keyframes is None else np.asarray(keyframes, dtype=np.int64)
+
+    def nearest_keyframe(self, index):
+        if self.keyframes is None:
+            return index
+        position = np.searchsorted(self.keyframes, index, side='right') - 1
+        if position < 0:
+            return 0
+        return int(self.keyframes[position])
+
+
+def _index_file_name(file_name):
+    return file_name + INDEX_FILE_SUFFIX
+
+
+def _file_signature(file_name):
+    stat = os.stat(file_name)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def _build_with_pyav(file_name, is_cancelled):
+    # Only demuxes, so it does not decode any frames. The keyframe flags are on the packets which come in decoding
+    # order, so the frame index of a keyframe is the rank of its pts among the pts of all the packets
+    import av
+
+    with av.open(file_name) as container:
+        stream = container.streams.video[0]
+        all_pts = []
+        keyframe_pts = []
+        for packet in container.demux(stream):
+            if is_cancelled():
+                return None
+            if packet.pts is None:
+                continue
+            all_pts.append(packet.pts)
+            if packet.is_keyframe:
+                keyframe_pts.append(packet.pts)
+
+    all_pts = np.sort(np.array(all_pts, dtype=np.int64))
+    keyframes = np.searchsorted(all_pts, np.array(keyframe_pts, dtype=np.int64))
+    return VideoIndex(len(all_pts), np.unique(keyframes))
+
+
+def _build_with_opencv(file_name, is_cancelled):
+    # OpenCV does not say which frames are keyframes so only the true frame count gets found (by grabbing every
+    # frame)
+    capture = cv2.VideoCapture(file_name)
+    frame_count = 0
+    try:
+        while capture.grab():
+            if is_cancelled():
+                return None
+            frame_count += 1
+    finally:
+        capture.release()
+    return VideoIndex(frame_count)
+
+
+def _is_never_cancelled():
+    return False
+
+
+def build(file_name, is_cancelled=_is_never_cancelled):
+    # Returns None if is_cancelled() became True before the index was built
+    try:
+        return _build_with_pyav(file_name, is_cancelled)
+    except ModuleNotFoundError:
+        print('PyAV is not installed so the keyframes of {} cannot be indexed. Only its true frame count will be '
+              'used'.format(file_name))
+        return _build_with_opencv(file_name, is_cancelled)
+
+
+def load_or_build(file_name, is_cancelled=_is_never_cancelled):
+    # The index is saved next to the video and reused as long as the video's size and modification time do not
+    # change. Building one can take a while (see VideoFrameReader for doing it in the background)
+    index_file_name = _index_file_name(file_name)
+    signature = _file_signature(file_name)
+
+    if os.path.exists(index_file_name):
+        try:
+            with np.load(index_file_name) as saved:
+                if np.array_equal(saved['signature'], signature):
+                    keyframes = saved['keyframes'] if 'keyframes' in saved.files else None
+                    return VideoIndex(saved['frame_count'], keyframes)
+        except (OSError, KeyError, ValueError):
+            pass
+
+    index = build(file_name, is_cancelled)
+    if index is None:
+        return None
+    saved = dict(signature=signature, frame_count=index.frame_count)
+    if index.keyframes is not None:
+        saved['keyframes'] = index.keyframes
+    try:
+        with open(index_file_name, 'wb') as index_file:
+            np.savez(index_file, **saved)
+    except OSError:
+        print('Could not save the frame index of {} to {}'.format(file_name, index_file_name))
+
+    return index
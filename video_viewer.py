@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from PyQt5.QtGui import QKeySequence
-from PyQt5.QtCore import Qt, QUrl, QPoint, QTime, QTimer
+from PyQt5.QtCore import Qt, QUrl, QPoint, QTime
 from PyQt5.QtMultimedia import QMediaContent, QMediaPlayer
 from PyQt5.QtMultimediaWidgets import QVideoWidget
 from PyQt5.QtWidgets import (QApplication, QHBoxLayout, QLineEdit,
@@ -12,14 +12,16 @@ import sys
 
 import uuid
 
-import constants as ct
+import frame_tap
+import scheduler
 
 open_windows = {}
 
 
 class VideoPlayer(QWidget):
 
-    def __init__(self, repl_globals=None, position_var_name=None, file_name_var_name=None, parent=None):
+    def __init__(self, repl_globals=None, position_var_name=None, file_name_var_name=None, frame_var_name=None,
+                 max_frame_rate=frame_tap.DEFAULT_MAX_FRAME_RATE, parent=None):
         super(VideoPlayer, self).__init__(parent)
 
         self.uuid = uuid.uuid4()
@@ -27,13 +29,12 @@ class VideoPlayer(QWidget):
         self.repl_globals = repl_globals
         self.position_var_name = position_var_name
         self.file_name_var_name = file_name_var_name
+        self.frame_var_name = frame_var_name
         self.frame_position = self.repl_globals[self.position_var_name]
 
         self.setGeometry(100, 300, 600, 380)
 
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.on_timer_tick)
-        self.timer.start(ct.TIMER_UPDATE_TIME_MILLIS)
+        scheduler.register(self, self.on_timer_tick)
 
         self.setAttribute(Qt.WA_NoSystemBackground, True)
         self.setAcceptDrops(True)
@@ -41,7 +42,19 @@ class VideoPlayer(QWidget):
         self.media_player.setVolume(80)
         self.video_widget = QVideoWidget(self)
 
-        self.media_player.setVideoOutput(self.video_widget)
+        # With a frame_var_name the frames go through a tap that also puts them in the REPL, on their way to the
+        # video widget
+        self.frame_tap = None
+        if self.frame_var_name is not None:
+            try:
+                target_surface = self.video_widget.videoSurface()
+            except AttributeError:
+                print('This version of Qt (older than 5.15) cannot show the video while giving out its frames')
+                target_surface = None
+            self.frame_tap = frame_tap.FrameTapSurface(target_surface, self.on_frame, max_frame_rate)
+            self.media_player.setVideoOutput(self.frame_tap)
+        else:
+            self.media_player.setVideoOutput(self.video_widget)
         self.media_player.stateChanged.connect(self.on_media_state_changed)
         self.media_player.positionChanged.connect(self.on_position_change)
         self.media_player.positionChanged.connect(self.handle_label)
@@ -126,6 +139,9 @@ class VideoPlayer(QWidget):
         self.setAcceptDrops(True)
         self.load_film(self.repl_globals[self.file_name_var_name])
 
+    def on_frame(self, frame):
+        self.repl_globals[self.frame_var_name] = frame
+
     def on_position_change(self, position):
         self.position_slider.setValue(position)
         self.repl_globals[self.position_var_name] = position
@@ -160,6 +176,7 @@ class VideoPlayer(QWidget):
 
     def handle_quit(self):
         self.media_player.stop()
+        scheduler.unregister(self)
         del open_windows[self.uuid]
         self.close()
 
@@ -210,6 +227,9 @@ class VideoPlayer(QWidget):
         self.time_viewer.setText(self.time.toString())
         self.frame_viewer.setText(str(self.media_player.position()))
 
+    def watched_variable_names(self):
+        return [self.position_var_name]
+
     def on_timer_tick(self):
         if self.media_player.state() != QMediaPlayer.PlayingState:
             self.media_player.setPosition(self.repl_globals[self.position_var_name])
@@ -260,8 +280,13 @@ windows = []
 #sys.exit(app.exec_())
 
 
-def video(repl_globals, position_var_name, file_name_var_name):
+def video(repl_globals, position_var_name, file_name_var_name, frame_var_name=None,
+          max_frame_rate=frame_tap.DEFAULT_MAX_FRAME_RATE):
+    # If a frame_var_name is given the frame on the screen also goes into that REPL variable (as an RGB array), at
+    # most max_frame_rate times a second so that the playback does not slow down
     win = VideoPlayer(repl_globals=repl_globals, position_var_name=position_var_name,
-                      file_name_var_name=file_name_var_name)
+                      file_name_var_name=file_name_var_name, frame_var_name=frame_var_name,
+                      max_frame_rate=max_frame_rate)
     open_windows[win.uuid] = win
     win.show()
+    return win